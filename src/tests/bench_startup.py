@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# /// script
+# requires-python = ">=3.11"
+# dependencies = []
+# ///
+"""Measure import time of each console script module with python -X importtime."""
+
+import argparse
+import subprocess
+import sys
+import tomllib
+from pathlib import Path
+
+PYPROJECT = Path(__file__).resolve().parents[2] / 'pyproject.toml'
+
+
+def console_scripts() -> dict[str, str]:
+    """Map console script name to its module, from pyproject.toml."""
+    with open(PYPROJECT, 'rb') as f:
+        scripts = tomllib.load(f)['project']['scripts']
+    return {name: target.split(':')[0] for name, target in scripts.items()}
+
+
+def import_times(module: str) -> list[tuple[int, int, str]]:
+    """Return (self us, cumulative us, name) for every module imported by module."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed: {result.stderr.strip().splitlines()[-1]}")
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix('import time:').split('|')
+        times.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('scripts', nargs='*', help='Console scripts to measure (default: all)')
+    parser.add_argument('-t', '--top', type=int, default=5, help='Show this many slowest imports per script')
+    parser.add_argument('--max-ms', type=float, help='Exit nonzero if any script imports slower than this')
+    args = parser.parse_args()
+
+    scripts = console_scripts()
+    over = []
+    for script in args.scripts or scripts:
+        module = scripts[script]
+        try:
+            times = import_times(module)
+        except RuntimeError as e:
+            print(f"{script:16} ERROR {e}")
+            over.append(script)
+            continue
+        total_ms = next(c for _, c, n in reversed(times) if n.strip() == module) / 1000
+        print(f"{script:16} {module:32} {total_ms:8.1f} ms")
+        for self_us, cumulative_us, name in sorted(times, key=lambda t: t[1], reverse=True)[1:args.top + 1]:
+            print(f"    {cumulative_us / 1000:8.1f} ms {name.strip()}")
+        if args.max_ms is not None and total_ms > args.max_ms:
+            over.append(script)
+
+    if over:
+        print(f"Over budget: {', '.join(over)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Tests for incremental scanning of apt-get upgrade output."""
+from update_tracker.update import MAX_LINE_BYTES, TAIL_BYTES, AptOutput
+
+PROMPT = (b"Configuration file '/etc/ssh/sshd_config'\n"
+          b" ==> Modified (by you or by a script) since installation.\n"
+          b" ==> Package distributor has shipped an updated version.\n"
+          b"*** sshd_config (Y/I/N/O/D/Z) [default=N] ? ")
+
+
+def test_prompt_names_configuration_file():
+    output = AptOutput('h')
+    assert output.feed(b'Setting up openssh-server ...\n') is None
+    assert output.feed(PROMPT) == '/etc/ssh/sshd_config'
+
+
+def test_prompt_split_across_chunks():
+    output = AptOutput('h')
+    fed = 0
+    while (conffile := output.feed(PROMPT[fed:fed + 7])) is None:
+        fed += 7
+    assert conffile == '/etc/ssh/sshd_config'
+    # reported as soon as the choices are complete
+    assert b'(Y/I/N/O/D/Z)' in PROMPT[:fed + 7]
+    assert b'(Y/I/N/O/D/Z)' not in PROMPT[:fed]
+
+
+def test_prompt_without_configuration_line():
+    output = AptOutput('h')
+    assert output.feed(b'*** foo.conf (Y/I/N/O/D/Z) [default=N] ? ') == 'foo.conf'
+
+
+def test_answered_clears_prompt():
+    output = AptOutput('h')
+    assert output.feed(PROMPT) is not None
+    output.answered('N')
+    assert output.feed(b'Setting up openssh-server ...\n') is None
+    assert output.feed(b'*** other.conf (Y/I/N/O/D/Z) [default=N] ? ') == 'other.conf'
+    assert 'N' in output.tail()
+
+
+def test_flags():
+    output = AptOutput('h')
+    output.feed(b'The following packages have been kept back:\n  linux-generic\n')
+    assert output.kept_back
+    assert not output.manual_intervention
+    output.feed(b"E: dpkg was interrupted, you must manually run 'dpkg --configure -a'")
+    assert not output.manual_intervention  # line not finished yet
+    output.feed(b'\n')
+    assert output.manual_intervention
+
+
+def test_long_line_is_scanned_and_dropped():
+    output = AptOutput('h')
+    output.feed(b'x' * MAX_LINE_BYTES + b' kept back')
+    assert output.kept_back
+    assert len(output._partial) == 0
+
+
+def test_tail_is_bounded():
+    output = AptOutput('h')
+    for i in range(1000):
+        output.feed(f'line {i}\n'.encode())
+    assert len(output._tail) <= 2 * TAIL_BYTES
+    assert output.tail().endswith('line 999')
+    assert 'line 0\n' not in output.tail()
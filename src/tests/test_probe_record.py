@@ -0,0 +1,44 @@
+"""Tests for parsing the host probe's JSON record."""
+from update_tracker.last_update import (BaseUpdateChecker, KernelStatus, kernel_status, parse_fingerprint,
+                                       parse_probe_record)
+
+
+def test_record_after_noise():
+    text = 'Welcome to host\n{"not": "a record"}\n  {"probe": 1, "ubuntu": true}  \n'
+    assert parse_probe_record(text) == {'probe': 1, 'ubuntu': True}
+
+
+def test_last_record_wins():
+    text = '{"probe": 1, "n": 1}\n{"probe": 1, "n": 2}\n'
+    assert parse_probe_record(text)['n'] == 2
+
+
+def test_no_record():
+    assert parse_probe_record('') is None
+    assert parse_probe_record('{"probe": 1, truncated\n') is None
+    assert parse_probe_record('{"probe": "1"}\n') is None
+
+
+def test_kernel_status_unknown():
+    unknown = KernelStatus(needs_reboot=None, available=None)
+    assert kernel_status(None) == unknown
+    assert kernel_status({'probe': 1, 'ubuntu': False, 'needs_reboot': True}) == unknown
+
+
+def test_kernel_status():
+    record = {'probe': 1, 'ubuntu': True, 'needs_reboot': 0, 'kernel_available': None,
+              'ubuntu_version': '22.04'}
+    assert kernel_status(record) == KernelStatus(needs_reboot=False, available=None,
+                                                 ubuntu_version='22.04')
+
+
+def test_fingerprint_line():
+    assert parse_fingerprint('@@update_tracker fingerprint@@ abc\n{"probe": 2}\n') == ('abc', False)
+    assert parse_fingerprint('banner\n@@update_tracker fingerprint@@ abc unchanged\n') == ('abc', True)
+    assert parse_fingerprint('@@update_tracker fingerprint@@ \n{"probe": 2}\n') == (None, False)
+    assert parse_fingerprint('') == (None, False)
+
+
+def test_unchanged_host_skips_record():
+    last = BaseUpdateChecker.parse_probe('@@update_tracker fingerprint@@ abc unchanged\n')
+    assert last.unchanged and last.fingerprint == 'abc'
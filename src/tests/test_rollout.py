@@ -0,0 +1,76 @@
+"""Tests for rollout wave planning and gating."""
+import pytest
+
+from update_tracker.rollout import RolloutPolicy, plan_waves, stop_reason
+
+GROUPS = {
+    'canary': ['c1'],
+    'web': ['w3', 'w1', 'w2'],
+    'db': ['d1', 'd2', 'w1'],
+}
+HOSTS = ['w1', 'w2', 'w3', 'd1', 'd2', 'c1', 'z9', 'zz']
+
+
+def test_count_canary_then_group_order():
+    plan = plan_waves(HOSTS, GROUPS, RolloutPolicy(wave_size=3, canary=2))
+    assert plan.canary
+    # canary group first, then web, then db, then hosts in no group
+    assert plan.waves == [['c1', 'w1'], ['w2', 'w3', 'd1'], ['d2', 'z9', 'zz']]
+
+
+def test_canary_group():
+    plan = plan_waves(HOSTS, GROUPS, RolloutPolicy(wave_size=3, canary_group='db'))
+    assert plan.canary
+    assert plan.waves == [['w1', 'd1', 'd2'], ['c1', 'w2', 'w3'], ['z9', 'zz']]
+
+
+def test_every_host_planned_once():
+    plan = plan_waves(HOSTS, GROUPS, RolloutPolicy(wave_size=2, canary=1))
+    planned = [h for wave in plan.waves for h in wave]
+    assert sorted(planned) == sorted(HOSTS)
+    assert all(len(wave) <= 2 for wave in plan.waves[1:])
+
+
+@pytest.mark.parametrize('policy', [
+    RolloutPolicy(wave_size=3, canary=0),
+    RolloutPolicy(wave_size=3, canary_group='canary'),
+])
+def test_no_canary_wave_when_none_selected(policy):
+    plan = plan_waves(['w1', 'w2', 'd1'], GROUPS, policy)
+    assert not plan.canary
+    assert plan.waves == [['w1', 'w2', 'd1']]
+
+
+def test_unknown_canary_group():
+    with pytest.raises(ValueError):
+        plan_waves(HOSTS, GROUPS, RolloutPolicy(canary_group='missing'))
+
+
+def test_no_hosts():
+    plan = plan_waves([], GROUPS, RolloutPolicy())
+    assert plan.waves == []
+    assert not plan.canary
+
+
+def test_canary_must_fully_succeed():
+    policy = RolloutPolicy(min_success=0.5)
+    assert stop_reason(policy, True, 9, 1, 1) is not None
+    assert stop_reason(policy, True, 10, 0, 0) is None
+    # the same wave is acceptable when it is not the canary
+    assert stop_reason(policy, False, 9, 1, 1) is None
+
+
+def test_min_success():
+    policy = RolloutPolicy(min_success=0.9)
+    assert stop_reason(policy, False, 9, 1, 1) is None
+    assert 'success rate' in stop_reason(policy, False, 8, 2, 2)
+
+
+def test_max_failures_counts_whole_rollout():
+    policy = RolloutPolicy(min_success=0.0, max_failures=3)
+    assert stop_reason(policy, False, 9, 1, 2) is None
+    assert 'limit' in stop_reason(policy, False, 9, 1, 3)
+
+
+def test_no_failure_limit():
+    assert stop_reason(RolloutPolicy(min_success=0.0), False, 1, 9, 1000) is None
@@ -1,20 +1,17 @@
 import dataclasses
-import importlib.metadata
 import logging
+from importlib import import_module
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Protocol
 
 update_tracker_logger = logging.getLogger(__name__)
 
-__version__ =  importlib.metadata.version('update_tracker')
-from update_tracker.db import postgres_connect
 
 class SshUser(Protocol):
     account: str
     keyfile: Path
 
-from update_tracker.query import query_ansible
 
 HostLimit = dict[str, int]
 
@@ -24,7 +21,28 @@ class HostSpec:
     only_these : list[str] = dataclasses.field(default_factory=list)
     host_limits : HostLimit = dataclasses.field(default_factory=dict)
 
-    def filter(self,hostname:str)->bool:
-        return self.only_these is None or len(self.only_these) == 0 or hostname in self.only_these
 
-from update_tracker.lib import add_common_args, setup_logging, load_config, build_host_limits
+# Re-exports are imported on first use so that importing the package does not pull in
+# psycopg, postgresql_access or yaml for entry points that never reach them
+_LAZY_EXPORTS = {
+    'postgres_connect': 'update_tracker.db',
+    'connection_pool': 'update_tracker.db',
+    'query_ansible': 'update_tracker.query',
+    'load_inventory': 'update_tracker.query',
+    'add_common_args': 'update_tracker.lib',
+    'setup_logging': 'update_tracker.lib',
+    'load_config': 'update_tracker.lib',
+    'build_host_limits': 'update_tracker.lib',
+}
+
+
+def __getattr__(name: str):
+    if name == '__version__':
+        from importlib.metadata import version
+        value = version('update_tracker')
+    elif name in _LAZY_EXPORTS:
+        value = getattr(import_module(_LAZY_EXPORTS[name]), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
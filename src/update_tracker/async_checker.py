@@ -0,0 +1,97 @@
+import asyncio
+import concurrent.futures
+import subprocess
+import threading
+
+from update_tracker import SshUser, update_tracker_logger
+from update_tracker.last_update import BaseUpdateChecker, LastUpdate
+
+
+class AsyncUpdateChecker(BaseUpdateChecker):
+    """Update checker that runs probes as asyncio subprocesses instead of pool threads.
+
+    The event loop runs on a private thread, so submit and get_last keep the blocking
+    UpdateChecker API. At most `concurrency` hosts are probed at once, each within
+    `deadline` seconds; a probe that overruns or is cancelled has its ssh process killed.
+    """
+
+    def __init__(self, ssh_user: SshUser, timeout: int, concurrency: int = 200, deadline: float = 60,
+                 fingerprint_extra: str = ''):
+        """
+        Args:
+            ssh_user: account and private key used for every connection
+            timeout: ssh ConnectTimeout in seconds
+            concurrency: maximum number of hosts probed simultaneously
+            deadline: seconds allowed for all of one host's ssh work
+            fingerprint_extra: settings the stored results depend on, see BaseUpdateChecker
+        """
+        super().__init__(ssh_user, timeout, deadline, fingerprint_extra)
+        self.concurrency = concurrency
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='scan-loop', daemon=True)
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def __enter__(self):
+        super().__enter__()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._thread.is_alive():
+            asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+        self._loop.close()
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+    async def _cancel_all(self):
+        current = asyncio.current_task()
+        tasks = [t for t in asyncio.all_tasks() if t is not current]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, hostname: str, fingerprint: str | None = None) -> concurrent.futures.Future:
+        """Schedule probe for hostname on the event loop and return the Future.
+
+        Cancelling the Future cancels the probe and kills its ssh process.
+        """
+        return asyncio.run_coroutine_threadsafe(self.probe(hostname, fingerprint), self._loop)
+
+    def get_last(self, hostname: str, fingerprint: str | None = None) -> LastUpdate:
+        return self.submit(hostname, fingerprint).result()
+
+    async def probe(self, hostname: str, fingerprint: str | None = None) -> LastUpdate:
+        """Probe hostname once a concurrency slot is free, within the per-host deadline."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(self._probe(hostname, fingerprint), self.deadline)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{hostname}: no result within {self.deadline}s") from None
+            finally:
+                await self._ssh.forget_async(hostname)
+
+    async def _probe(self, hostname: str, fingerprint: str | None) -> LastUpdate:
+        await self._ssh.ensure_master_async(hostname, self.subprocess_timeout)
+        update_tracker_logger.info(f"Sampling {hostname}")
+        _, stdout, stderr = await self._run(hostname, self.probe_command(fingerprint), self._PROBE_SCRIPT)
+        last = self.parse_probe(stdout, stderr)
+        if last.unchanged:
+            update_tracker_logger.info(f"{hostname}: unchanged since last sample")
+        return last
+
+    async def _run(self, hostname: str, remote: str, stdin: str | None = None) -> tuple[int, str, str]:
+        """Run remote on hostname; returns (returncode, stdout, stderr)."""
+        proc = await asyncio.create_subprocess_exec(
+            *self._ssh.command(hostname, remote, start_master=False),
+            stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            stdout, stderr = await proc.communicate(stdin.encode() if stdin is not None else None)
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+        return proc.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
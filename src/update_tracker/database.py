@@ -1,9 +1,97 @@
 #!/usr/bin/env python3
 import datetime
 from dataclasses import dataclass, field
+from typing import Iterator
 
 from update_tracker import HostSpec
 
+# Issue categories in report order; the names match the Overdue fields
+NEVER_UPDATED = 'never_updated'
+UPDATE_OLD = 'update_old'
+KERNEL_NEEDS_REBOOT = 'kernel_needs_reboot'
+KERNEL_AVAILABLE = 'kernel_available'
+OLD_VERSION = 'old_version'
+CATEGORIES = (NEVER_UPDATED, UPDATE_OLD, KERNEL_NEEDS_REBOOT, KERNEL_AVAILABLE, OLD_VERSION)
+
+# audit.host_updates joined with the per-host update limits, which are passed in as
+# arrays so the overdue comparison runs in Postgres. Parameters come from hosts_params.
+HOSTS_CTE = '''
+    limits(hostname, update_days) AS (
+        SELECT * FROM unnest(%(limit_hosts)s::text[], %(limit_days)s::int[])
+    ),
+    hosts AS (
+        SELECT hu.hostname, hu.last_update, hu.kernel_needs_reboot, hu.kernel_available, hu.old_version,
+               %(today)s::date - hu.last_update AS days_since,
+               COALESCE(l.update_days, 0) AS update_days
+        FROM audit.host_updates hu
+        LEFT JOIN limits l ON l.hostname = hu.hostname
+        WHERE (%(only_these)s::text[] IS NULL OR hu.hostname = ANY(%(only_these)s::text[]))
+          AND (%(show_all)s OR NOT EXISTS (
+                SELECT 1 FROM audit.update_schedule us
+                WHERE us.hostname = hu.hostname AND us.update_schedule IS NOT NULL))
+    )'''
+
+# issues and iter_issues: one row per host and issue category
+ISSUES_SQL = f'''
+    WITH {HOSTS_CTE}
+    SELECT category, hostname, last_update, days_since, update_days FROM (
+        SELECT 1 AS ord, '{NEVER_UPDATED}' AS category, * FROM hosts WHERE last_update IS NULL
+        UNION ALL
+        SELECT 2, '{UPDATE_OLD}', * FROM hosts WHERE days_since > update_days
+        UNION ALL
+        SELECT 3, '{KERNEL_NEEDS_REBOOT}', * FROM hosts WHERE kernel_needs_reboot
+        UNION ALL
+        SELECT 4, '{KERNEL_AVAILABLE}', * FROM hosts WHERE kernel_available
+        UNION ALL
+        SELECT 5, '{OLD_VERSION}', * FROM hosts WHERE old_version
+    ) issues
+    WHERE category = ANY(%(categories)s::text[])
+    ORDER BY ord, CASE WHEN ord = 2 THEN days_since END DESC, hostname'''
+
+# notification_candidates: hosts with an issue whose owner has not been notified
+NOTIFY_SQL = f'''
+    WITH {HOSTS_CTE}
+    SELECT h.hostname, h.last_update IS NULL OR h.days_since > h.update_days,
+           h.kernel_needs_reboot, h.kernel_available, h.old_version, um.person_id,
+           p.first_name, p.email
+    FROM hosts h
+    LEFT JOIN audit.update_schedule us ON h.hostname = us.hostname
+    LEFT JOIN audit.user_managed um ON h.hostname = um.hostname
+    LEFT JOIN public.persons p ON um.person_id = p.id
+    WHERE us.update_schedule IS NULL
+      AND um.next_upgrade IS NULL
+      AND um.person_id IS NOT NULL
+      AND NOT um.user_managed
+      AND (h.last_update IS NULL OR h.days_since > h.update_days
+           OR h.kernel_needs_reboot OR h.kernel_available OR h.old_version)
+    ORDER BY h.hostname'''
+
+
+# scan: sample time of recently sampled hosts and every stored fingerprint
+PREFETCH_SQL = '''
+    SELECT hostname, sample_time >= %s, sample_time, fingerprint
+    FROM audit.host_updates
+    WHERE sample_time >= %s OR fingerprint IS NOT NULL
+'''
+
+# update kernel
+KERNEL_ISSUES_SQL = '''
+    SELECT hostname, kernel_needs_reboot, kernel_available
+    FROM audit.host_updates
+    WHERE kernel_needs_reboot = true OR kernel_available = true
+    ORDER BY hostname
+'''
+
+
+@dataclass
+class Issue:
+    """One host in one issue category."""
+    category: str
+    hostname: str
+    last_update: datetime.date | None
+    days_since: int | None  # days since last_update; None if never updated
+    update_limit: int       # the host's 'update days'
+
 
 @dataclass
 class Overdue:
@@ -21,50 +109,81 @@ class Overdue:
                 + len(self.kernel_needs_reboot) + len(self.kernel_available) + len(self.old_version))
 
 
-def report(conn, host_spec: HostSpec, show_all: bool = False):
-    """Query database and return overdue hosts checked against per-host limits.
+def hosts_params(host_spec: HostSpec, show_all: bool = False) -> dict:
+    """Query parameters for HOSTS_CTE."""
+    return {
+        'limit_hosts': list(host_spec.host_limits.keys()),
+        'limit_days': list(host_spec.host_limits.values()),
+        'only_these': list(host_spec.only_these) if host_spec.only_these else None,
+        'show_all': show_all,
+        'today': datetime.date.today(),
+    }
+
+
+def _issues_params(host_spec: HostSpec, show_all: bool, categories: tuple[str, ...]) -> dict:
+    return hosts_params(host_spec, show_all) | {'categories': list(categories)}
+
+
+def issues(conn, host_spec: HostSpec, show_all: bool = False,
+           categories: tuple[str, ...] = CATEGORIES) -> list[Issue]:
+    """Return the hosts in each issue category, classified and sorted by Postgres.
+
+    Rows come in CATEGORIES order; UPDATE_OLD hosts are sorted most overdue first and
+    the other categories by hostname. A host appears once per category it falls in.
 
     Args:
         conn: Database connection
         host_spec: HostSpec containing host_limits (hostname -> update_days)
         show_all: If False (default), suppress hosts that have an update_schedule in
                   audit.update_schedule (they are managed via a regular schedule).
+        categories: only return these categories
     """
     cursor = conn.cursor()
+    cursor.execute(ISSUES_SQL, _issues_params(host_spec, show_all, categories))
+    return [Issue(*row) for row in cursor.fetchall()]
 
-    scheduled_hosts: set[str] = set()
-    if not show_all:
-        cursor.execute('SELECT hostname FROM audit.update_schedule where update_schedule is not null')
-        scheduled_hosts = {row[0] for row in cursor.fetchall()}
 
-    cursor.execute('''SELECT hostname, last_update, sample_time, kernel_needs_reboot, kernel_available, old_version
-        FROM audit.host_updates
-        ORDER BY hostname''')
+def iter_issues(conn, host_spec: HostSpec, show_all: bool = False,
+                categories: tuple[str, ...] = CATEGORIES, itersize: int = 500) -> Iterator[Issue]:
+    """Like issues, but yield rows from a server-side cursor as Postgres produces them.
 
-    current_date = datetime.date.today()
-    issues = Overdue()
+    Only `itersize` rows are held client side at a time. The cursor lives in the
+    connection's current transaction, so the caller should commit or close the
+    connection once the iterator is exhausted.
+    """
+    with conn.cursor(name='update_tracker_issues') as cursor:
+        cursor.itersize = itersize
+        cursor.execute(ISSUES_SQL, _issues_params(host_spec, show_all, categories))
+        for row in cursor:
+            yield Issue(*row)
 
-    for row in cursor.fetchall():
-        hostname, last_update, sample_time, kernel_needs_reboot, kernel_available, old_version = row
-        if not host_spec.filter(hostname):
-            continue
-        if hostname in scheduled_hosts:
-            continue
 
-        update_limit = host_spec.host_limits.get(hostname, 0)
+def report(conn, host_spec: HostSpec, show_all: bool = False):
+    """Query database and return overdue hosts checked against per-host limits.
 
-        if last_update is None:
-            issues.never_updated.append(hostname)
+    Args:
+        conn: Database connection
+        host_spec: HostSpec containing host_limits (hostname -> update_days)
+        show_all: If False (default), suppress hosts that have an update_schedule in
+                  audit.update_schedule (they are managed via a regular schedule).
+    """
+    overdue = Overdue()
+    for issue in iter_issues(conn, host_spec, show_all):
+        if issue.category == UPDATE_OLD:
+            overdue.update_old.append((issue.hostname, issue.last_update, issue.days_since))
         else:
-            if (current_date - last_update).days > update_limit:
-                days_since_update = (current_date - last_update).days
-                issues.update_old.append((hostname, last_update, days_since_update))
-
-        if kernel_needs_reboot:
-            issues.kernel_needs_reboot.append(hostname)
-        if kernel_available:
-            issues.kernel_available.append(hostname)
-        if old_version:
-            issues.old_version.append(hostname)
-
-    return issues
+            getattr(overdue, issue.category).append(issue.hostname)
+    return overdue
+
+
+def notification_candidates(conn, host_spec: HostSpec) -> list[tuple]:
+    """Hosts whose owner should be told about a pending upgrade.
+
+    Returns:
+        (hostname, update overdue, kernel_needs_reboot, kernel_available, old_version, person_id,
+        first_name, email) for unscheduled, not user-managed hosts with an owner and at least
+        one issue; first_name and email are None if person_id is not in public.persons
+    """
+    cursor = conn.cursor()
+    cursor.execute(NOTIFY_SQL, hosts_params(host_spec, show_all=True))
+    return cursor.fetchall()
@@ -1,9 +1,147 @@
-from postgresql_access import DatabaseDict
+import atexit
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
 
-import psycopg
+from update_tracker import update_tracker_logger
 
+if TYPE_CHECKING:
+    import psycopg
+
+POOL_SIZE = 4
+# psycopg prepares a statement server side once it has run this many times on a connection
+PREPARE_THRESHOLD = 1
+# idle connections older than this are checked with a round trip before reuse
+CHECK_IDLE_SECONDS = 30.0
+
+
+def _database(config):
+    # postgresql_access pulls in psycopg and keyring; only pay for them when connecting
+    from postgresql_access import DatabaseDict
 
-def postgres_connect(config)->psycopg.Connection:
     db = DatabaseDict(dictionary=config['database'])
     db.set_app_name("update tracker")
-    return db.connect()
+    return db
+
+
+def postgres_connect(config) -> 'psycopg.Connection':
+    """Open a new, unpooled connection."""
+    return _database(config).connect()
+
+
+class ConnectionPool:
+    """Keep database connections open for reuse.
+
+    Connections are opened on demand, up to size at once; getconn blocks when all are
+    in use. A returned connection has any open transaction rolled back, and one that has
+    been idle for CHECK_IDLE_SECONDS is pinged before it is handed out again, so a
+    connection dropped by the server or proxy is replaced rather than returned broken.
+
+    The 'database' section of the configuration may set 'pool size' and
+    'prepare threshold' (None disables server-side prepared statements).
+    """
+
+    def __init__(self, config: dict):
+        settings = config['database']
+        self.size = int(settings.get('pool size', POOL_SIZE))
+        self.prepare_threshold = settings.get('prepare threshold', PREPARE_THRESHOLD)
+        self._db = _database(config)
+        self._idle: deque[tuple['psycopg.Connection', float]] = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._closed = False
+
+    def getconn(self, timeout: float | None = None) -> 'psycopg.Connection':
+        """Check out a healthy connection; return it with putconn."""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No database connection free within {timeout}s")
+        try:
+            return self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn: 'psycopg.Connection') -> None:
+        """Return a connection from getconn; uncommitted work is rolled back."""
+        try:
+            self._checkin(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: float | None = None) -> Iterator['psycopg.Connection']:
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self) -> None:
+        """Close idle connections; connections still checked out are closed when returned."""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _ in idle:
+            conn.close()
+
+    def _connect(self) -> 'psycopg.Connection':
+        conn = self._db.connect()
+        conn.prepare_threshold = self.prepare_threshold
+        return conn
+
+    def _checkout(self) -> 'psycopg.Connection':
+        import psycopg
+
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if not self._idle:
+                    break
+                conn, returned = self._idle.pop()
+            if conn.closed or conn.broken:
+                continue
+            if time.monotonic() - returned < CHECK_IDLE_SECONDS:
+                return conn
+            try:
+                conn.execute('SELECT 1')
+                conn.rollback()
+                return conn
+            except psycopg.Error as e:
+                update_tracker_logger.info(f"Discarding stale database connection: {e}")
+                conn.close()
+        return self._connect()
+
+    def _checkin(self, conn: 'psycopg.Connection') -> None:
+        import psycopg
+
+        if conn.closed or conn.broken:
+            return
+        if conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+            try:
+                conn.rollback()
+            except psycopg.Error:
+                conn.close()
+                return
+        with self._lock:
+            if not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def connection_pool(config) -> ConnectionPool:
+    """The process-wide pool for config['database'], created on first use."""
+    key = repr(sorted(config['database'].items()))
+    with _pools_lock:
+        if (pool := _pools.get(key)) is None:
+            pool = _pools[key] = ConnectionPool(config)
+            atexit.register(pool.close)
+        return pool
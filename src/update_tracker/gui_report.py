@@ -1,32 +1,367 @@
 #!/usr/bin/env python3
 import argparse
+import concurrent.futures
 import datetime
+from collections import Counter, deque
+from pathlib import Path
+from typing import Callable
 
-from PySide6.QtCore import Qt, QProcess, QProcessEnvironment
+from PySide6.QtCore import (
+    Qt, QObject, QProcess, QProcessEnvironment, Signal, QAbstractTableModel, QModelIndex,
+    QSortFilterProxyModel, QTimer,
+)
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QCheckBox, QScrollArea, QPushButton, QTextEdit, QGroupBox,
-    QTabWidget,
+    QLabel, QPushButton, QGroupBox, QTabWidget, QProgressBar,
+    QTableView, QHeaderView, QLineEdit, QAbstractItemView, QPlainTextEdit, QSplitter,
 )
 
-from update_tracker import postgres_connect, HostSpec, add_common_args, setup_logging, load_config, build_host_limits
-from update_tracker.database import report
+from update_tracker import update_tracker_logger, connection_pool, HostSpec, add_common_args, setup_logging, load_config, build_host_limits
+from update_tracker.database import Issue, issues as query_issues, CATEGORIES, NEVER_UPDATED, UPDATE_OLD, \
+    KERNEL_NEEDS_REBOOT, KERNEL_AVAILABLE, OLD_VERSION
+from update_tracker.query import cache_dir
+
+SORT_ROLE = Qt.ItemDataRole.UserRole
+CATEGORY_ROLE = Qt.ItemDataRole.UserRole + 1
+_NEVER = 1 << 30  # sorts never-updated hosts as the most overdue
+LOG_LINES = 2000     # output lines kept in memory per host; the full log is on disk
+REPAINT_MS = 250     # update output is shown at most this often
+
+
+class _LoadSignals(QObject):
+    """Carries results from the loader thread; receivers run on the UI thread."""
+    loaded = Signal(object, object)  # host limits, list[Issue]
+    failed = Signal(str)
+
+
+class IssueTableModel(QAbstractTableModel):
+    """Every flagged host in every category, one row per (category, host).
+
+    Check state belongs to the hostname, so a host listed in several categories is
+    selected in all of them. set_issues applies a refresh as row inserts, removals and
+    changes rather than a reset, so views keep their scroll position and checks.
+    """
+    COLUMNS = ('Host', 'Last update', 'Days since', 'Limit')
+    selection_changed = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows: list[Issue] = []
+        self._index: dict[tuple[str, str], int] = {}  # (category, hostname) -> row
+        self._checked: set[str] = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        issue = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            return (issue.hostname,
+                    str(issue.last_update) if issue.last_update else "never",
+                    issue.days_since,
+                    issue.update_limit)[column]
+        if role == SORT_ROLE:
+            return (issue.hostname,
+                    issue.last_update.toordinal() if issue.last_update else 0,
+                    _NEVER if issue.days_since is None else issue.days_since,
+                    issue.update_limit)[column]
+        if role == CATEGORY_ROLE:
+            return issue.category
+        if role == Qt.ItemDataRole.CheckStateRole and column == 0:
+            return Qt.CheckState.Checked if issue.hostname in self._checked else Qt.CheckState.Unchecked
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() == 0:
+            flags |= Qt.ItemFlag.ItemIsUserCheckable
+        return flags
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != Qt.ItemDataRole.CheckStateRole or index.column() != 0:
+            return False
+        hostname = self._rows[index.row()].hostname
+        if Qt.CheckState(value) == Qt.CheckState.Checked:
+            self._checked.add(hostname)
+        else:
+            self._checked.discard(hostname)
+        for category in CATEGORIES:
+            if (row := self._index.get((category, hostname))) is not None:
+                cell = self.index(row, 0)
+                self.dataChanged.emit(cell, cell, [Qt.ItemDataRole.CheckStateRole])
+        self.selection_changed.emit()
+        return True
+
+    def checked_hosts(self) -> list[str]:
+        return sorted(self._checked)
+
+    def set_issues(self, issues: list[Issue]):
+        """Replace the contents, touching only rows that were added, removed or changed."""
+        new = {(i.category, i.hostname): i for i in issues}
+
+        # remove vanished rows from the bottom up, one contiguous run at a time
+        gone = sorted((row for key, row in self._index.items() if key not in new), reverse=True)
+        while gone:
+            last = first = gone.pop(0)
+            while gone and gone[0] == first - 1:
+                first = gone.pop(0)
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self._rows[first:last + 1]
+            self.endRemoveRows()
+        self._index = {(i.category, i.hostname): row for row, i in enumerate(self._rows)}
+
+        added = []
+        for key, issue in new.items():
+            if (row := self._index.get(key)) is None:
+                added.append(issue)
+            elif self._rows[row] != issue:
+                self._rows[row] = issue
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1))
+        if added:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(added) - 1)
+            self._rows.extend(added)
+            self._index.update({(i.category, i.hostname): start + n for n, i in enumerate(added)})
+            self.endInsertRows()
+
+        present = {i.hostname for i in issues}
+        if self._checked - present:
+            self._checked &= present
+            self.selection_changed.emit()
+
+
+class CategoryProxy(QSortFilterProxyModel):
+    """One category of an IssueTableModel, filtered by hostname substring."""
+
+    def __init__(self, category: str, parent=None):
+        super().__init__(parent)
+        self.category = category
+        self.setSortRole(SORT_ROLE)
+        self.setFilterKeyColumn(0)
+        self.setFilterCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.setDynamicSortFilter(True)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        return (index.data(CATEGORY_ROLE) == self.category
+                and super().filterAcceptsRow(source_row, source_parent))
+
+
+class UpdateRunner(QObject):
+    """Run the update script on hosts with ansible, one process per host, at most
+    `jobs` at a time; the rest wait in a queue."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+
+    state_changed = Signal(str, str)  # hostname, state
+    finished = Signal()               # queue drained and every process exited
+
+    def __init__(self, ansible_config: str, update_script: str, jobs: int, dry_run: bool = False,
+                 on_output: Callable[[str, str], None] | None = None, parent=None):
+        """
+        Args:
+            on_output: called with (hostname, text) for every chunk a process writes;
+                       a plain callback rather than a signal, as chunks can arrive by the thousand
+        """
+        super().__init__(parent)
+        self.on_output = on_output or (lambda hostname, text: None)
+        self.ansible_config = ansible_config
+        self.update_script = update_script
+        self.jobs = max(jobs, 1)
+        self.dry_run = dry_run
+        self.states: dict[str, str] = {}
+        self._queue: deque[str] = deque()
+        self._running: dict[str, QProcess] = {}
+        self._filling = False
+
+    def start(self, hosts: list[str]):
+        for hostname in hosts:
+            self._queue.append(hostname)
+            self._set_state(hostname, self.QUEUED)
+        self._fill()
+
+    def counts(self) -> Counter:
+        return Counter(self.states.values())
+
+    def _set_state(self, hostname: str, state: str):
+        self.states[hostname] = state
+        self.state_changed.emit(hostname, state)
+
+    def _fill(self):
+        # a process that fails to start finishes inside _start, which calls back here
+        if self._filling:
+            return
+        self._filling = True
+        try:
+            while self._queue and len(self._running) < self.jobs:
+                self._start(self._queue.popleft())
+        finally:
+            self._filling = False
+        if not self._queue and not self._running:
+            self.finished.emit()
+
+    def _start(self, hostname: str):
+        args = [hostname + ',', '-m', 'shell', '-a', f'sudo {self.update_script}']
+        if self.dry_run:
+            args.append('--check')
+        self.on_output(hostname, f"Running: ansible {' '.join(args)}\n")
+
+        process = QProcess(self)
+        env = QProcessEnvironment.systemEnvironment()
+        env.insert('ANSIBLE_CONFIG', self.ansible_config)
+        process.setProcessEnvironment(env)
+        process.readyReadStandardOutput.connect(
+            lambda p=process, h=hostname: self.on_output(h, self._read(p.readAllStandardOutput()))
+        )
+        process.readyReadStandardError.connect(
+            lambda p=process, h=hostname: self.on_output(h, self._read(p.readAllStandardError()))
+        )
+        process.finished.connect(
+            lambda exit_code, status, h=hostname: self._on_finished(h, exit_code, status)
+        )
+        process.errorOccurred.connect(
+            lambda error, p=process, h=hostname: self._on_error(h, p, error)
+        )
+        self._running[hostname] = process
+        self._set_state(hostname, self.RUNNING)
+        process.start('ansible', args)
+
+    @staticmethod
+    def _read(data) -> str:
+        return data.data().decode('utf-8', errors='replace')
+
+    def _on_error(self, hostname: str, process: QProcess, error: QProcess.ProcessError):
+        # finished is not emitted for a process that never started
+        if error == QProcess.ProcessError.FailedToStart:
+            self._on_finished(hostname, -1, QProcess.ExitStatus.CrashExit, process.errorString())
+
+    def _on_finished(self, hostname: str, exit_code: int, status: QProcess.ExitStatus, error: str = ''):
+        process = self._running.pop(hostname, None)
+        if process is None:
+            return
+        process.deleteLater()
+        self.on_output(hostname, f"\n{error}\nDone (exit code: {exit_code})" if error
+                         else f"\nDone (exit code: {exit_code})")
+        ok = exit_code == 0 and status == QProcess.ExitStatus.NormalExit
+        self._set_state(hostname, self.FINISHED if ok else self.FAILED)
+        self._fill()
+
+
+class HostLog:
+    """Output of one host's update: the last LOG_LINES lines in memory, all of it on disk."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lines: deque[str] = deque(maxlen=LOG_LINES)
+        self.unshown: deque[str] = deque(maxlen=LOG_LINES)  # lines added since the last repaint
+        self._partial = ''
+        self._file = None
+
+    def write(self, text: str):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(text)
+        *complete, self._partial = (self._partial + text).split('\n')
+        self.lines.extend(complete)
+        self.unshown.extend(complete)
+
+    @property
+    def last_line(self) -> str:
+        return self._partial or next((line for line in reversed(self.lines) if line.strip()), '')
+
+    def close(self):
+        if self._partial:
+            self.write('\n')
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RunTableModel(QAbstractTableModel):
+    """Summary of an update run: one row per host with its state and latest output line."""
+    COLUMNS = ('Host', 'State', 'Output')
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.hosts: list[str] = []
+        self._row: dict[str, int] = {}
+        self.states: dict[str, str] = {}
+        self.logs: dict[str, HostLog] = {}
+
+    def start_run(self, hosts: list[str], log_dir: Path):
+        self.beginResetModel()
+        for log in self.logs.values():
+            log.close()
+        self.hosts = list(hosts)
+        self._row = {h: row for row, h in enumerate(self.hosts)}
+        self.states = {}
+        self.logs = {h: HostLog(log_dir / f'{h}.log') for h in self.hosts}
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.hosts)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        hostname = self.hosts[index.row()]
+        return (hostname, self.states.get(hostname, ''), self.logs[hostname].last_line)[index.column()]
+
+    def host_changed(self, hostname: str):
+        row = self._row[hostname]
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.COLUMNS) - 1),
+                              [Qt.ItemDataRole.DisplayRole])
 
 
 class UpdateTrackerWindow(QMainWindow):
-    def __init__(self, config: dict, host_limits: dict, show_all: bool = False, dry_run: bool = False,
-                 current_ubuntu: str | None = None):
+    def __init__(self, config: dict, host_limits: dict | None = None, show_all: bool = False,
+                 dry_run: bool = False, current_ubuntu: str | None = None, jobs: int = 10):
+        """
+        Args:
+            host_limits: per-host update limits; parsed from the inventory in the
+                         background when omitted
+            jobs: maximum number of hosts updated at once
+        """
         super().__init__()
         self.config = config
         self.host_limits = host_limits
         self.show_all = show_all
         self.dry_run = dry_run
         self.current_ubuntu = current_ubuntu
-        self.server_checkboxes: list[tuple[str, QCheckBox]] = []
-        self.active_processes: dict[QProcess, str] = {}
-        self.host_output_widgets: dict[str, QTextEdit] = {}
+        self.jobs = jobs
+        self.runner: UpdateRunner | None = None
+        self._dirty_hosts: set[str] = set()
         self.pending_count = 0
 
+        # Inventory parsing and database queries run here, never on the UI thread
+        self._loader = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='gui-load')
+        self._load_signals = _LoadSignals()
+        self._load_signals.loaded.connect(self._apply_report)
+        self._load_signals.failed.connect(self._load_failed)
+        self._loading = False
+
         title = "Update Tracker"
         if dry_run:
             title += " [DRY RUN]"
@@ -41,7 +376,26 @@ class UpdateTrackerWindow(QMainWindow):
         self.header_label.setWordWrap(True)
         main_layout.addWidget(self.header_label)
 
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter hosts")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.textChanged.connect(self._apply_filter)
+        main_layout.addWidget(self.filter_edit)
+
+        self.hosts_model = IssueTableModel(self)
+        self.hosts_model.selection_changed.connect(self._update_selected_panel)
+        old_title = f"Old Ubuntu (< {current_ubuntu})" if current_ubuntu else "Old Ubuntu Version"
+        self.tab_titles = {
+            NEVER_UPDATED: "Never Updated",
+            UPDATE_OLD: "Outdated Updates",
+            KERNEL_NEEDS_REBOOT: "Kernel Reboot Needed",
+            KERNEL_AVAILABLE: "Kernel Update Available",
+            OLD_VERSION: old_title,
+        }
+        self.proxies: dict[str, CategoryProxy] = {}
         self.tabs = QTabWidget()
+        for category in CATEGORIES:
+            self.tabs.addTab(self._category_view(category), self.tab_titles[category])
         main_layout.addWidget(self.tabs, stretch=2)
 
         selected_group = QGroupBox("Selected Servers")
@@ -51,11 +405,33 @@ class UpdateTrackerWindow(QMainWindow):
         selected_layout.addWidget(self.selected_label)
         main_layout.addWidget(selected_group)
 
-        self.output_tabs = QTabWidget()
-        self.output_tabs.setMinimumHeight(100)
-        main_layout.addWidget(self.output_tabs, stretch=1)
+        # Update run: summary table of hosts beside the log of the selected one
+        self.run_model = RunTableModel(self)
+        self.run_view = QTableView()
+        self.run_view.setModel(self.run_model)
+        self.run_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.run_view.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.run_view.verticalHeader().hide()
+        self.run_view.horizontalHeader().setStretchLastSection(True)
+        self.run_view.selectionModel().currentRowChanged.connect(self._show_host_log)
+        self.log_view = QPlainTextEdit()
+        self.log_view.setReadOnly(True)
+        self.log_view.setMaximumBlockCount(LOG_LINES)
+        self.log_view.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.shown_host: str | None = None
+        output_splitter = QSplitter()
+        output_splitter.addWidget(self.run_view)
+        output_splitter.addWidget(self.log_view)
+        output_splitter.setStretchFactor(1, 2)
+        output_splitter.setMinimumHeight(100)
+        main_layout.addWidget(output_splitter, stretch=1)
         self._set_output_placeholder("Output will appear here when Update is clicked.")
 
+        # Output arrives far faster than it needs to be drawn; repaint on a timer
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setInterval(REPAINT_MS)
+        self.repaint_timer.timeout.connect(self._repaint_output)
+
         btn_layout = QHBoxLayout()
         self.refresh_btn = QPushButton("Refresh")
         self.refresh_btn.clicked.connect(self.load_report)
@@ -67,35 +443,91 @@ class UpdateTrackerWindow(QMainWindow):
         btn_layout.addWidget(self.update_btn)
         main_layout.addLayout(btn_layout)
 
+        self.busy = QProgressBar()
+        self.busy.setRange(0, 0)
+        self.busy.setMaximumWidth(150)
+        self.busy.hide()
+        self.statusBar().addPermanentWidget(self.busy)
+
         self.load_report()
 
+    def _category_view(self, category: str) -> QTableView:
+        proxy = CategoryProxy(category, self)
+        proxy.setSourceModel(self.hosts_model)
+        self.proxies[category] = proxy
+        view = QTableView()
+        view.setModel(proxy)
+        view.setSortingEnabled(True)
+        if category == UPDATE_OLD:
+            view.sortByColumn(2, Qt.SortOrder.DescendingOrder)
+        else:
+            view.sortByColumn(0, Qt.SortOrder.AscendingOrder)
+        view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        view.verticalHeader().hide()
+        view.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        # rows are uniform; let the view skip per-row size hints
+        view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        return view
+
+    def _apply_filter(self, text: str):
+        for proxy in self.proxies.values():
+            proxy.setFilterFixedString(text)
+        self._update_tab_titles()
+
+    def _update_tab_titles(self):
+        for i, category in enumerate(CATEGORIES):
+            self.tabs.setTabText(i, f"{self.tab_titles[category]} ({self.proxies[category].rowCount()})")
+
+    def closeEvent(self, event):
+        self._loader.shutdown(wait=False, cancel_futures=True)
+        super().closeEvent(event)
+
     def _set_output_placeholder(self, text: str):
-        self._clear_output_tabs()
-        label = QLabel(text)
-        label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.output_tabs.addTab(label, "Output")
-
-    def _clear_output_tabs(self):
-        while self.output_tabs.count():
-            w = self.output_tabs.widget(0)
-            self.output_tabs.removeTab(0)
-            if w:
-                w.deleteLater()
+        self.shown_host = None
+        self.log_view.setPlainText(text)
 
     def load_report(self):
-        self.server_checkboxes = []
-        while self.tabs.count():
-            w = self.tabs.widget(0)
-            self.tabs.removeTab(0)
-            if w:
-                w.deleteLater()
-        self.selected_label.setText("(none)")
-
-        conn = postgres_connect(self.config)
-        hs = HostSpec(host_limits=self.host_limits)
-        issues = report(conn, hs, show_all=self.show_all)
-        conn.close()
+        """Start loading the report in the background; the current one stays up meanwhile."""
+        if self._loading:
+            return
+        self._loading = True
+        self.refresh_btn.setEnabled(False)
+        self.update_btn.setEnabled(False)
+        if self.host_limits is None:
+            self.header_label.setText("<b>UPDATE TRACKER REPORT</b><br>Loading inventory...")
+        self.statusBar().showMessage("Loading report...")
+        self.busy.show()
+        self._loader.submit(self._fetch_report, self.host_limits)
+
+    def _fetch_report(self, host_limits: dict | None):
+        """Runs on the loader thread."""
+        try:
+            if host_limits is None:
+                host_limits = build_host_limits(self.config)
+            hs = HostSpec(host_limits=host_limits)
+            with connection_pool(self.config).connection() as conn:
+                issues = query_issues(conn, hs, show_all=self.show_all)
+            self._load_signals.loaded.emit(host_limits, issues)
+        except Exception as e:
+            update_tracker_logger.exception("Report load failed")
+            self._load_signals.failed.emit(str(e))
+
+    def _load_finished(self, message: str):
+        self._loading = False
+        self.busy.hide()
+        self.statusBar().showMessage(message, 5000)
+        if self.pending_count == 0:
+            self.refresh_btn.setEnabled(True)
+            self.update_btn.setEnabled(True)
 
+    def _load_failed(self, error: str):
+        self._load_finished(f"Load failed: {error}")
+        if self.host_limits is None:
+            self.header_label.setText(f"<b>UPDATE TRACKER REPORT</b><br>Could not load: {error}")
+
+    def _apply_report(self, host_limits: dict, issues: list[Issue]):
+        self.host_limits = host_limits
         current_time = datetime.datetime.now().astimezone()
         a = self.config['ansible']
         c = self.config['cutoffs']
@@ -109,52 +541,16 @@ class UpdateTrackerWindow(QMainWindow):
             f"Limits: {limits_text}"
         )
 
-        self._add_tab("Never Updated", [
-            (h, h) for h in sorted(issues.never_updated)
-        ])
-        self._add_tab("Outdated Updates", [
-            (h, f"{h}: last updated {date} ({days} days ago, limit: {self.host_limits.get(h, 0)})")
-            for h, date, days in sorted(issues.update_old, key=lambda x: x[2], reverse=True)
-        ])
-        self._add_tab("Kernel Reboot Needed", [
-            (h, h) for h in sorted(issues.kernel_needs_reboot)
-        ])
-        self._add_tab("Kernel Update Available", [
-            (h, h) for h in sorted(issues.kernel_available)
-        ])
-        old_title = f"Old Ubuntu (< {self.current_ubuntu})" if self.current_ubuntu else "Old Ubuntu Version"
-        self._add_tab(old_title, [
-            (h, h) for h in sorted(issues.old_version)
-        ])
-
-        if self.tabs.count() == 0:
-            placeholder = QLabel("All servers are up to date!")
-            placeholder.setAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.tabs.addTab(placeholder, "Status")
-
-    def _add_tab(self, title: str, items: list[tuple[str, str]]):
-        if not items:
-            return
-        scroll = QScrollArea()
-        scroll.setWidgetResizable(True)
-        widget = QWidget()
-        layout = QVBoxLayout(widget)
-        layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        for hostname, label_text in items:
-            cb = QCheckBox(label_text)
-            cb.setChecked(False)
-            cb.stateChanged.connect(self._update_selected_panel)
-            layout.addWidget(cb)
-            self.server_checkboxes.append((hostname, cb))
-        scroll.setWidget(widget)
-        self.tabs.addTab(scroll, f"{title} ({len(items)})")
+        self.hosts_model.set_issues(issues)
+        self._update_tab_titles()
+        self._load_finished(f"Loaded {len(issues)} issue(s)" if issues else "All servers are up to date!")
 
     def _update_selected_panel(self):
-        selected = sorted({h for h, cb in self.server_checkboxes if cb.isChecked()})
+        selected = self.hosts_model.checked_hosts()
         self.selected_label.setText(', '.join(selected) if selected else "(none)")
 
     def run_update(self):
-        selected = sorted({h for h, cb in self.server_checkboxes if cb.isChecked()})
+        selected = self.hosts_model.checked_hosts()
         if not selected:
             self._set_output_placeholder("No servers selected.")
             return
@@ -165,56 +561,60 @@ class UpdateTrackerWindow(QMainWindow):
             return
 
         ansible_config = str(self.config['ansible']['config'])
-        self._clear_output_tabs()
-        self.active_processes = {}
-        self.host_output_widgets = {}
+        log_dir = cache_dir() / 'update-logs' / datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.run_model.start_run(selected, log_dir)
+        self._set_output_placeholder(f"Full logs: {log_dir}")
+        self._dirty_hosts = set()
         self.pending_count = len(selected)
 
-        for hostname in selected:
-            output_edit = QTextEdit()
-            output_edit.setReadOnly(True)
-            self.output_tabs.addTab(output_edit, hostname)
-            self.host_output_widgets[hostname] = output_edit
-
-            args = [hostname + ',', '-m', 'shell', '-a', f'sudo {update_script}']
-            if self.dry_run:
-                args.append('--check')
-            output_edit.append(f"Running: ansible {' '.join(args)}\n")
-
-            process = QProcess(self)
-            env = QProcessEnvironment.systemEnvironment()
-            env.insert('ANSIBLE_CONFIG', ansible_config)
-            process.setProcessEnvironment(env)
-            process.readyReadStandardOutput.connect(
-                lambda p=process, h=hostname: self._on_host_stdout(p, h)
-            )
-            process.readyReadStandardError.connect(
-                lambda p=process, h=hostname: self._on_host_stderr(p, h)
-            )
-            process.finished.connect(
-                lambda exit_code, _status, h=hostname: self._on_host_finished(exit_code, h)
-            )
-            self.active_processes[process] = hostname
-            process.start('ansible', args)
-
+        self.runner = UpdateRunner(ansible_config, update_script, self.jobs, self.dry_run,
+                                   on_output=self._on_host_output, parent=self)
+        self.runner.state_changed.connect(self._on_host_state)
+        self.runner.finished.connect(self._on_update_finished)
         self.update_btn.setEnabled(False)
         self.refresh_btn.setEnabled(False)
-
-    def _on_host_stdout(self, process: QProcess, hostname: str):
-        data = process.readAllStandardOutput().data().decode('utf-8', errors='replace')
-        self.host_output_widgets[hostname].append(data.rstrip())
-
-    def _on_host_stderr(self, process: QProcess, hostname: str):
-        data = process.readAllStandardError().data().decode('utf-8', errors='replace')
-        self.host_output_widgets[hostname].append(data.rstrip())
-
-    def _on_host_finished(self, exit_code: int, hostname: str):
-        self.host_output_widgets[hostname].append(f"\nDone (exit code: {exit_code})")
-        self.pending_count -= 1
-        if self.pending_count == 0:
-            self.update_btn.setEnabled(True)
-            self.refresh_btn.setEnabled(True)
-            self.load_report()
+        self.repaint_timer.start()
+        self.runner.start(selected)
+
+    def _on_host_output(self, hostname: str, text: str):
+        self.run_model.logs[hostname].write(text)
+        self._dirty_hosts.add(hostname)
+
+    def _on_host_state(self, hostname: str, state: str):
+        self.run_model.states[hostname] = state
+        if state in (UpdateRunner.FINISHED, UpdateRunner.FAILED):
+            self.run_model.logs[hostname].close()
+            self.pending_count -= 1
+        self._dirty_hosts.add(hostname)
+
+    def _repaint_output(self):
+        """Apply output and state changes since the last tick in one pass."""
+        for hostname in self._dirty_hosts:
+            self.run_model.host_changed(hostname)
+            log = self.run_model.logs[hostname]
+            if hostname == self.shown_host and log.unshown:
+                self.log_view.appendPlainText('\n'.join(log.unshown))
+            log.unshown.clear()
+        self._dirty_hosts.clear()
+        if self.runner is not None:
+            counts = self.runner.counts()
+            self.statusBar().showMessage(
+                f"Updating: {counts[UpdateRunner.QUEUED]} queued, {counts[UpdateRunner.RUNNING]} running, "
+                f"{counts[UpdateRunner.FINISHED]} finished, {counts[UpdateRunner.FAILED]} failed")
+
+    def _show_host_log(self, current: QModelIndex, _previous: QModelIndex):
+        if not current.isValid():
+            return
+        self.shown_host = self.run_model.hosts[current.row()]
+        log = self.run_model.logs[self.shown_host]
+        self.log_view.setPlainText('\n'.join(log.lines))
+        log.unshown.clear()
+
+    def _on_update_finished(self):
+        self.repaint_timer.stop()
+        self._repaint_output()
+        self.pending_count = 0
+        self.load_report()
 
 
 def main():
@@ -224,15 +624,17 @@ def main():
                         help="Include hosts that have a regular update schedule")
     parser.add_argument('--dry-run', action='store_true',
                         help="Pass --check to ansible; show what would run without executing")
+    parser.add_argument('-j', '--jobs', type=int, default=10,
+                        help="Maximum number of hosts updated at once")
     args = parser.parse_args()
 
     setup_logging(args)
     config = load_config(args)
-    host_limits = build_host_limits(config)
     current_ubuntu = str(config['current ubuntu']) if 'current ubuntu' in config else None
     app = QApplication([])
-    window = UpdateTrackerWindow(config, host_limits, show_all=args.show_all, dry_run=args.dry_run,
-                                 current_ubuntu=current_ubuntu)
+    # host limits (a full inventory parse) are loaded by the window in the background
+    window = UpdateTrackerWindow(config, show_all=args.show_all, dry_run=args.dry_run,
+                                 current_ubuntu=current_ubuntu, jobs=args.jobs)
     window.show()
     app.exec()
 
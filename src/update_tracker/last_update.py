@@ -1,12 +1,23 @@
 import concurrent.futures
 import datetime
+import json
 import re
+import shlex
 import subprocess
-import tempfile
+import time
 from dataclasses import dataclass, field
-from pathlib import Path
 
 from update_tracker import SshUser, update_tracker_logger
+from update_tracker.ssh import SshPool
+
+# Version of the record printed by the probe script; bump when fields change meaning
+PROBE_VERSION = 2
+# Ends the raw apt history printed by the fallback for hosts without python3
+_PROBE_MARKER = '@@update_tracker probe@@'
+# Starts the line with the host's fingerprint, printed before the probe runs
+_FINGERPRINT_MARKER = '@@update_tracker fingerprint@@'
+# Number of recent upgrade dates the probe reports
+RECENT_UPGRADES = 5
 
 
 @dataclass
@@ -23,23 +34,117 @@ class LastUpdate:
     kernel_needs_reboot: bool | None = field(default=None)  # newer kernel installed but not running
     kernel_available: bool | None = field(default=None)     # newer kernel available in apt
     ubuntu_version: str | None = field(default=None)        # e.g. "22.04"; None if not Ubuntu
+    # Most recent apt-get upgrade dates, newest first (empty when parsed locally)
+    recent_upgrades: list[datetime.date] = field(default_factory=list)
+    fingerprint: str | None = field(default=None)  # cheap host state digest, see BaseUpdateChecker.probe_command
+    unchanged: bool = field(default=False)  # fingerprint matched; probe skipped and other fields not sampled
+
+
+def parse_apt_history(text: str) -> datetime.date | None:
+    """Return the most recent Start-Date of an apt-get upgrade in apt history text."""
+    last_upgrade_date = None
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith('Start-Date:'):
+            # Format: Start-Date: 2024-01-25  10:30:15
+            match = re.search(r'Start-Date:\s+(\d{4}-\d{2}-\d{2})', line)
+            if match and i + 1 < len(lines):
+                next_line = lines[i + 1]
+                if 'apt-get' in next_line and 'upgrade' in next_line:
+                    date_str = match.group(1)
+                    current_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+                    if last_upgrade_date is None or current_date > last_upgrade_date:
+                        last_upgrade_date = current_date
+    return last_upgrade_date
+
+
+def parse_probe_record(text: str) -> dict | None:
+    """Return the JSON record printed by the probe script, or None if there is none."""
+    for line in reversed(text.splitlines()):
+        line = line.strip()
+        if line.startswith('{'):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and isinstance(record.get('probe'), int):
+                return record
+    return None
+
+
+def parse_fingerprint(stdout: str) -> tuple[str | None, bool]:
+    """Return (fingerprint, unchanged) from the fingerprint line of the probe output.
+
+    The fingerprint is None when the host's state could not be read.
+    """
+    for line in stdout.splitlines():
+        if line.startswith(_FINGERPRINT_MARKER):
+            fields = line[len(_FINGERPRINT_MARKER):].split()
+            if not fields:
+                return None, False
+            return fields[0], fields[1:] == ['unchanged']
+    return None, False
+
+
+def kernel_status(record: dict | None) -> KernelStatus:
+    """Build KernelStatus from a probe record; unknown when missing or not Ubuntu."""
+    if record is None or not record.get('ubuntu'):
+        return KernelStatus(needs_reboot=None, available=None)
+    needs_reboot = record.get('needs_reboot')
+    available = record.get('kernel_available')
+    return KernelStatus(
+        needs_reboot=None if needs_reboot is None else bool(needs_reboot),
+        available=None if available is None else bool(available),
+        ubuntu_version=record.get('ubuntu_version') or None,
+    )
+
+
+class BaseUpdateChecker:
+    """Probe commands, their parsing and the ssh connections shared by the scan engines."""
+
+    # Streamed to the remote python3 over stdin; prints one JSON record
+    _PROBE_SCRIPT = """\
+import glob, gzip, json, re, subprocess, sys
+
+record = {'probe': %d, 'ubuntu': False}
 
-class UpdateChecker:
-    _REMOTE_SCRIPT = '/tmp/_check_kernel.py'
-    _KERNEL_SCRIPT = """\
-import re, subprocess, sys
+def finish():
+    print(json.dumps(record))
+    sys.exit(0)
+
+# Start-Date lines followed by an apt-get upgrade command line
+start_re = re.compile(r'Start-Date:\\s+(\\d{4}-\\d{2}-\\d{2})')
+upgrades = set()
+try:
+    paths = glob.glob('/var/log/apt/history*')
+    if not paths:
+        raise OSError('no /var/log/apt/history files')
+    for path in paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', errors='replace') as f:
+            start = None
+            for line in f:
+                if start is not None and 'apt-get' in line and 'upgrade' in line:
+                    upgrades.add(start)
+                m = start_re.match(line)
+                start = m.group(1) if m else None
+except OSError as e:
+    record['history_error'] = str(e)
+    finish()
+recent = sorted(upgrades, reverse=True)
+record['last_update'] = recent[0] if recent else None
+record['upgrades'] = recent[:%d]
 
 try:
     with open('/etc/os-release') as f:
         content = f.read()
-        if 'ubuntu' not in content.lower():
-            print('not-ubuntu')
-            sys.exit(0)
-        m = re.search(r'VERSION_ID="?([\\d.]+)"?', content)
-        ubuntu_version = m.group(1) if m else ''
 except FileNotFoundError:
-    print('not-ubuntu')
-    sys.exit(0)
+    finish()
+if 'ubuntu' not in content.lower():
+    finish()
+m = re.search(r'VERSION_ID="?([\\d.]+)"?', content)
+record['ubuntu'] = True
+record['ubuntu_version'] = m.group(1) if m else None
 
 current = subprocess.run(['uname', '-r'], capture_output=True, text=True).stdout.strip()
 
@@ -51,103 +156,136 @@ for line in dpkg.stdout.splitlines():
         versions.append(pkg.replace('linux-image-', ''))
 
 newest = sorted(set(versions), key=lambda v: tuple(int(x) for x in re.findall(r'\\d+', v)))[-1]
-needs_reboot = 1 if newest != current else 0
+record['needs_reboot'] = newest != current
 
 subprocess.run(['apt-get', 'update', '-qq'], capture_output=True)
 apt_list = subprocess.run(['apt', 'list', '--upgradable'], capture_output=True, text=True)
-available = sum(1 for line in apt_list.stdout.splitlines() if 'linux-image' in line)
+record['kernel_available'] = any('linux-image' in line for line in apt_list.stdout.splitlines())
+
+finish()
+""" % (PROBE_VERSION, RECENT_UPGRADES)
 
-print(f'ubuntu:{needs_reboot}:{available}:{ubuntu_version}')
-"""
+    # Without python3 the raw history comes back, followed by a marker line with zcat's exit status
+    _PROBE_COMMAND = ('if command -v python3 >/dev/null 2>&1; then python3 -; '
+                      f'else zcat -f /var/log/apt/history*; echo "{_PROBE_MARKER} $?"; fi')
 
-    def __init__(self, ssh_user: SshUser, timeout: int):
+    # Digest of the apt history and dpkg status file identity, the running kernel and
+    # fingerprint_extra; empty if any of it cannot be read
+    _FINGERPRINT_COMMAND = ("state=$(stat -c '%n %s %Y %i' /var/log/apt/history.log* /var/lib/dpkg/status"
+                            " && uname -r) && fp=$(printf '%s\\n%s\\n' \"$state\" {extra} | sha256sum)"
+                            " && fp=${{fp%% *}} || fp=")
+
+    def __init__(self, ssh_user: SshUser, timeout: int, deadline: float = 60, fingerprint_extra: str = ''):
+        """
+        Args:
+            ssh_user: account and private key used for every connection
+            timeout: ssh ConnectTimeout in seconds
+            deadline: seconds allowed for all of one host's ssh work
+            fingerprint_extra: settings the stored results depend on (e.g. the current
+                Ubuntu release); changing it changes every host's fingerprint
+        """
         self.subprocess_timeout = timeout + 5
-        self._account = ssh_user.account
-        self._ssh_opts = [
-            '-i', str(ssh_user.keyfile),
-            '-o', f'ConnectTimeout={timeout}',
-            '-o', 'ServerAliveInterval=5',
-            '-o', 'ServerAliveCountMax=3',
-            '-o', 'StrictHostKeyChecking=no',
-            '-o', 'UserKnownHostsFile=/dev/null',
-        ]
-        self.scp_base = ['scp'] + self._ssh_opts
-        self._local_script: Path | None = None
-        self._executor = concurrent.futures.ThreadPoolExecutor()
+        self.deadline = deadline
+        self.fingerprint_extra = fingerprint_extra
+        self._ssh = SshPool(ssh_user, timeout)
 
     def __enter__(self):
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-            f.write(self._KERNEL_SCRIPT)
-            self._local_script = Path(f.name)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._executor.shutdown(wait=False)
-        if self._local_script is not None:
-            self._local_script.unlink(missing_ok=True)
+        self._ssh.close()
         return False
 
-    def submit(self, hostname: str) -> concurrent.futures.Future:
+    def probe_command(self, fingerprint: str | None = None) -> str:
+        """Remote command that prints the host's fingerprint line, then probes it.
+
+        Args:
+            fingerprint: fingerprint stored at the last sample; when the host still
+                matches it the command stops after the fingerprint line
+        """
+        return (self._FINGERPRINT_COMMAND.format(extra=shlex.quote(self.fingerprint_extra)) + '; '
+                f'if [ -n "$fp" ] && [ "$fp" = {shlex.quote(fingerprint or "")} ]; then '
+                f'echo "{_FINGERPRINT_MARKER} $fp unchanged"; exit 0; fi; '
+                f'echo "{_FINGERPRINT_MARKER} $fp"; ' + self._PROBE_COMMAND)
+
+    @staticmethod
+    def parse_probe(stdout: str, stderr: str = '') -> LastUpdate:
+        """Build LastUpdate from the output of probe_command."""
+        fingerprint, unchanged = parse_fingerprint(stdout)
+        if unchanged:
+            return LastUpdate(update=None, fingerprint=fingerprint, unchanged=True)
+        last = BaseUpdateChecker._parse_record(stdout, stderr)
+        last.fingerprint = fingerprint
+        return last
+
+    @staticmethod
+    def _parse_record(stdout: str, stderr: str) -> LastUpdate:
+        history, fallback, status = ('\n' + stdout).partition(f'\n{_PROBE_MARKER} ')
+        if fallback:
+            # no python3 on the host: parse the shipped history here, kernel state unknown
+            if status.strip() != '0':
+                raise RuntimeError(f"Failed to get apt history: {stderr}")
+            return LastUpdate(update=parse_apt_history(history))
+
+        record = parse_probe_record(stdout)
+        if record is None:
+            raise RuntimeError(f"No probe record: {stderr}")
+        if 'history_error' in record:
+            raise RuntimeError(f"Failed to get apt history: {record['history_error']}")
+        if record['probe'] > PROBE_VERSION:
+            update_tracker_logger.debug(f"probe record version {record['probe']} newer than {PROBE_VERSION}")
+        last_update = record.get('last_update')
+        kernel = kernel_status(record)
+        return LastUpdate(update=datetime.date.fromisoformat(last_update) if last_update else None,
+                          kernel_needs_reboot=kernel.needs_reboot,
+                          kernel_available=kernel.available,
+                          ubuntu_version=kernel.ubuntu_version,
+                          recent_upgrades=[datetime.date.fromisoformat(d) for d in record.get('upgrades', [])])
+
+
+class UpdateChecker(BaseUpdateChecker):
+    """Probe hosts on a thread pool."""
+
+    def __init__(self, ssh_user: SshUser, timeout: int, deadline: float = 60, fingerprint_extra: str = ''):
+        super().__init__(ssh_user, timeout, deadline, fingerprint_extra)
+        self._executor = concurrent.futures.ThreadPoolExecutor()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._executor.shutdown(wait=False)
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+    def submit(self, hostname: str, fingerprint: str | None = None) -> concurrent.futures.Future:
         """Submit get_last for hostname to the thread pool and return the Future."""
-        return self._executor.submit(self.get_last, hostname)
-
-    def get_last(self, hostname: str) -> LastUpdate:
-        update_tracker_logger.info(f"Sampling {hostname}")
-        remote_user_host = f'{self._account}@{hostname}'
-        ssh_base = ['ssh'] + self._ssh_opts + [remote_user_host]
-
-        apt_cmd = ssh_base + ['zless /var/log/apt/history*']
-        apt_result = subprocess.run(apt_cmd, capture_output=True, text=True, timeout=self.subprocess_timeout)
-
-        if apt_result.returncode != 0:
-            raise RuntimeError(f"Failed to get apt history: {apt_result.stderr}")
-
-        # Parse apt history for Start-Date entries followed by apt-get upgrade commands
-        last_upgrade_date = None
-        lines = apt_result.stdout.splitlines()
-        for i, line in enumerate(lines):
-            if line.startswith('Start-Date:'):
-                # Format: Start-Date: 2024-01-25  10:30:15
-                match = re.search(r'Start-Date:\s+(\d{4}-\d{2}-\d{2})', line)
-                if match and i + 1 < len(lines):
-                    next_line = lines[i + 1]
-                    if 'apt-get' in next_line and 'upgrade' in next_line:
-                        date_str = match.group(1)
-                        current_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-                        if last_upgrade_date is None or current_date > last_upgrade_date:
-                            last_upgrade_date = current_date
-
-        kernel_status = self._check_newer_kernel(ssh_base, remote_user_host)
-
-        return LastUpdate(update=last_upgrade_date,
-                          kernel_needs_reboot=kernel_status.needs_reboot,
-                          kernel_available=kernel_status.available,
-                          ubuntu_version=kernel_status.ubuntu_version)
-
-    def _check_newer_kernel(self, ssh_base: list, remote_user_host: str) -> KernelStatus:
-        scp_cmd = self.scp_base + [str(self._local_script), f'{remote_user_host}:{self._REMOTE_SCRIPT}']
-        subprocess.run(scp_cmd, capture_output=True, timeout=self.subprocess_timeout)
-
-        result = subprocess.run(
-            ssh_base + [f'python3 {self._REMOTE_SCRIPT}'],
-            capture_output=True,
-            text=True,
-            timeout=self.subprocess_timeout,
-        )
-
-        output = result.stdout.strip()
-        if output == 'not-ubuntu':
-            return KernelStatus(needs_reboot=None, available=None)
-        if output.startswith('ubuntu:'):
-            parts = output.split(':')
-            if len(parts) >= 3:
-                try:
-                    version = parts[3] if len(parts) >= 4 else None
-                    return KernelStatus(
-                        needs_reboot=bool(int(parts[1])),
-                        available=bool(int(parts[2])),
-                        ubuntu_version=version or None,
-                    )
-                except ValueError:
-                    pass
-        return KernelStatus(needs_reboot=None, available=None)
+        return self._executor.submit(self.get_last, hostname, fingerprint)
+
+    def get_last(self, hostname: str, fingerprint: str | None = None) -> LastUpdate:
+        """Probe hostname with a single ssh invocation, all within self.deadline seconds.
+
+        Args:
+            hostname: host to sample
+            fingerprint: fingerprint stored at the last sample; when the host still
+                matches it the probe is skipped and LastUpdate.unchanged is set
+        Raises:
+            TimeoutError: the deadline passed; the running ssh process has been killed
+        """
+        end = time.monotonic() + self.deadline
+
+        def remaining() -> float:
+            left = end - time.monotonic()
+            if left <= 0:
+                raise subprocess.TimeoutExpired(hostname, self.deadline)
+            return left
+
+        try:
+            self._ssh.ensure_master(hostname, timeout=remaining())
+            update_tracker_logger.info(f"Sampling {hostname}")
+            result = self._ssh.run(hostname, self.probe_command(fingerprint), input=self._PROBE_SCRIPT,
+                                   timeout=remaining())
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"{hostname}: no result within {self.deadline}s") from None
+        finally:
+            self._ssh.forget(hostname)
+        last = self.parse_probe(result.stdout, result.stderr)
+        if last.unchanged:
+            update_tracker_logger.info(f"{hostname}: unchanged since last sample")
+        return last
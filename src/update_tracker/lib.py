@@ -1,9 +1,8 @@
 import argparse
 import logging
 
-import yaml
-
-from update_tracker import query_ansible, update_tracker_logger
+from update_tracker import update_tracker_logger
+from update_tracker.query import Inventory, load_inventory
 
 
 def add_common_args(parser: argparse.ArgumentParser) -> None:
@@ -21,22 +20,19 @@ def setup_logging(args: argparse.Namespace) -> None:
 
 def load_config(args: argparse.Namespace) -> dict:
     """Reed args.yaml"""
+    import yaml
+
     with open(args.yaml) as f:
         return yaml.safe_load(f)
 
 
-def build_host_limits(config: dict) -> dict[str, int]:
-    """Read config for host limits"""
-    a = config['ansible']
-    c = config['cutoffs']
-    host_limits: dict[str, int] = {}
-    for inv_name in a['inventory']:
-        inv_limits = c[inv_name]
-        update_days = inv_limits['update days']
-        group_inv = query_ansible(a['config'], [inv_name])
-        for host in group_inv.inventory:
-            if host in host_limits:
-                host_limits[host] = max(host_limits[host], update_days)
-            else:
-                host_limits[host] = update_days
-    return host_limits
+def build_host_limits(config: dict, inventory: Inventory | None = None) -> dict[str, int]:
+    """Read config for host limits
+
+    Args:
+        config: update_tracker configuration
+        inventory: already loaded inventory; loaded from config when omitted
+    """
+    if inventory is None:
+        inventory = load_inventory(config)
+    return inventory.host_limits(config['cutoffs'])
@@ -1,22 +1,35 @@
 #!/usr/bin/env python3
 import argparse
+import concurrent.futures
 import datetime
+import sys
 from concurrent.futures import Future
 
-from update_tracker import update_tracker_logger, postgres_connect, add_common_args, setup_logging, load_config, build_host_limits
+from update_tracker import update_tracker_logger, connection_pool, HostSpec, add_common_args, setup_logging, load_config, build_host_limits
+from update_tracker.database import issues, PREFETCH_SQL, NEVER_UPDATED, UPDATE_OLD
 from update_tracker.last_update import UpdateChecker
-from update_tracker.query import query_ansible
+from update_tracker.query import load_inventory
+from update_tracker.schema import has_column, maintain_sample_partitions, SAMPLE_RETENTION_MONTHS
+from update_tracker.writer import ResultWriter
 
 
-def get_last_sample_time(conn, hostname: str) -> datetime.datetime | None:
-    """Get the last sample time for a host."""
+def prefetch_samples(conn, cutoff: datetime.datetime) -> tuple[dict[str, datetime.datetime], dict[str, str]]:
+    """Fetch what scan needs from earlier samples in one query.
+
+    Returns:
+        (sample time of each host sampled since cutoff, stored fingerprint of each host)
+    """
     cursor = conn.cursor()
-    cursor.execute(
-        'SELECT sample_time FROM audit.host_updates WHERE hostname = %s',
-        (hostname,)
-    )
-    row = cursor.fetchone()
-    return row[0] if row else None
+    cursor.execute(PREFETCH_SQL, (cutoff, cutoff))
+    recent: dict[str, datetime.datetime] = {}
+    fingerprints: dict[str, str] = {}
+    for hostname, is_recent, sample_time, fingerprint in cursor.fetchall():
+        if is_recent:
+            recent[hostname] = sample_time
+        if fingerprint is not None:
+            fingerprints[hostname] = fingerprint
+    conn.commit()
+    return recent, fingerprints
 
 
 def _is_old_ubuntu(version: str, current: str) -> bool:
@@ -26,29 +39,6 @@ def _is_old_ubuntu(version: str, current: str) -> bool:
     return parts(version) < parts(current)
 
 
-def store_update(conn, hostname: str,
-                 last_update_date: datetime.date | None,
-                 sample_time: datetime.datetime,
-                 kernel_needs_reboot: bool | None = None,
-                 kernel_available: bool | None = None,
-                 old_version: bool | None = None):
-    """Store host update information in the database."""
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO audit.host_updates
-            (hostname, last_update, sample_time, kernel_needs_reboot, kernel_available, old_version)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        ON CONFLICT (hostname) DO UPDATE SET
-            last_update = EXCLUDED.last_update,
-            sample_time = EXCLUDED.sample_time,
-            kernel_needs_reboot = EXCLUDED.kernel_needs_reboot,
-            kernel_available = EXCLUDED.kernel_available,
-            old_version = EXCLUDED.old_version
-    ''', (hostname, last_update_date, sample_time,
-          kernel_needs_reboot, kernel_available, old_version))
-    conn.commit()
-
-
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     add_common_args(parser)
@@ -58,45 +48,54 @@ def main():
                         help="Only sample this single server")
     parser.add_argument('-n', '--now', action='store_true',
                         help="Resample all hosts regardless of last sample time")
+    parser.add_argument('-f', '--full', action='store_true',
+                        help="Run the full probe even on hosts whose fingerprint is unchanged")
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads',
+                        help="Scan engine: thread pool, or asyncio subprocesses for large fleets")
+    parser.add_argument('-c', '--concurrency', type=int, default=200,
+                        help="Maximum hosts probed at once (asyncio engine)")
+    parser.add_argument('-d', '--deadline', type=float, default=60,
+                        help="Seconds allowed for all ssh work on one host")
 
     args = parser.parse_args()
     setup_logging(args)
     config = load_config(args)
-    conn = postgres_connect(config)
-    a = config['ansible']
+    pool = connection_pool(config)
+    conn = pool.getconn()
+    # fingerprints are read and written on every host (schema migration 2)
+    if not has_column(conn, 'audit.host_updates', 'fingerprint'):
+        pool.putconn(conn)
+        sys.exit("audit.host_updates has no fingerprint column; run schema to migrate the database")
     c = config['cutoffs']
     current_ubuntu = config.get('current ubuntu')
     ssh_seconds = c['ssh seconds']
     sample_cutoff_hours = c['sample hours']
     sample_cutoff_delta = datetime.timedelta(hours=sample_cutoff_hours)
+    sample_time = datetime.datetime.now(datetime.timezone.utc)
 
-    host_limits = build_host_limits(config)
+    # Fetch earlier samples while the inventory loads
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as prefetcher:
+        prefetch = prefetcher.submit(prefetch_samples, conn, sample_time - sample_cutoff_delta)
 
-    # Get combined inventory (provides SSH credentials)
-    inv = query_ansible(a['config'], a['inventory'])
-    update_tracker_logger.info(f"Found {len(inv.inventory)} hosts")
+        # Combined inventory (provides SSH credentials) and per-host limits from one parse
+        inv = load_inventory(config)
+        host_limits = build_host_limits(config, inv)
+        update_tracker_logger.info(f"Found {len(inv.inventory)} hosts")
 
-    sample_time = datetime.datetime.now(datetime.timezone.utc)
+        recent_samples, fingerprints = prefetch.result()
+    if args.full:
+        fingerprints = {}
 
     # Determine which hosts to sample
     if args.server:
         hosts_to_sample = [args.server]
         update_tracker_logger.info(f"Single-server mode: sampling {args.server}")
     elif args.resample:
-        # Check each host against its per-host limits to find overdue ones
-        cursor = conn.cursor()
-        cursor.execute('SELECT hostname, last_update FROM audit.host_updates')
-
-        current_date = datetime.date.today()
-        overdue_hosts = set()
-        for hostname, last_update in cursor.fetchall():
-            update_limit = host_limits.get(hostname, 0)
-
-            if last_update is None:
-                overdue_hosts.add(hostname)
-            elif (current_date - last_update).days > update_limit:
-                overdue_hosts.add(hostname)
-
+        # Overdue hosts (by per-host limits) come straight from the database
+        overdue = issues(conn, HostSpec(host_limits=host_limits), show_all=True,
+                         categories=(NEVER_UPDATED, UPDATE_OLD))
+        conn.commit()
+        overdue_hosts = {issue.hostname for issue in overdue}
         hosts_to_sample = [host for host in inv.inventory if host in overdue_hosts]
         update_tracker_logger.info(
             f"Resample mode: sampling {len(hosts_to_sample)} overdue hosts out of {len(inv.inventory)} total"
@@ -106,28 +105,46 @@ def main():
 
     processed = 0
     skipped = 0
+    unchanged = 0
+
+    # old_version depends on current_ubuntu, so changing it must re-probe unchanged hosts
+    fingerprint_extra = f'current ubuntu {current_ubuntu}' if current_ubuntu else ''
+    if args.engine == 'asyncio':
+        from update_tracker.async_checker import AsyncUpdateChecker
+        checker_context = AsyncUpdateChecker(inv, ssh_seconds, concurrency=args.concurrency,
+                                             deadline=args.deadline, fingerprint_extra=fingerprint_extra)
+    else:
+        checker_context = UpdateChecker(inv, ssh_seconds, deadline=args.deadline,
+                                        fingerprint_extra=fingerprint_extra)
+
+    # Sample history needs this month's partition; expired months are dropped
+    history = maintain_sample_partitions(conn, sample_time.date(),
+                                         config.get('sample retention months', SAMPLE_RETENTION_MONTHS))
 
-    with UpdateChecker(inv, ssh_seconds) as checker:
+    with ResultWriter(conn, history=history) as writer, checker_context as checker:
         # Submit all hosts to thread pool, skipping recently-sampled ones
-        futures: dict[str, Future] = {}
+        futures: dict[Future, str] = {}
         for host in hosts_to_sample:
             update_tracker_logger.debug(f"host {host}")
             if not args.resample and not args.server and not args.now:
-                last_sample = get_last_sample_time(conn, host)
-                if last_sample:
+                if (last_sample := recent_samples.get(host)) is not None:
                     time_since_sample = sample_time - last_sample
-                    if time_since_sample < sample_cutoff_delta:
-                        update_tracker_logger.info(
-                            f"{host}: skipped (last sampled {time_since_sample.total_seconds() / 3600:.1f} hours ago)"
-                        )
-                        skipped += 1
-                        continue
-            futures[host] = checker.submit(host)
-
-        # Collect results and write to database
-        for host, future in futures.items():
+                    update_tracker_logger.info(
+                        f"{host}: skipped (last sampled {time_since_sample.total_seconds() / 3600:.1f} hours ago)"
+                    )
+                    skipped += 1
+                    continue
+            futures[checker.submit(host, fingerprints.get(host))] = host
+
+        # Collect results as they complete; each probe enforces its own deadline
+        for future in concurrent.futures.as_completed(futures):
+            host = futures[future]
             try:
-                r = future.result(timeout=60)
+                r = future.result()
+                if r.unchanged:
+                    writer.touch(host, sample_time)
+                    unchanged += 1
+                    continue
                 update_info = r.update if r.update else "never"
                 old_version = None
                 if r.ubuntu_version and current_ubuntu:
@@ -137,16 +154,20 @@ def main():
                     f"kernel_needs_reboot={r.kernel_needs_reboot}, kernel_available={r.kernel_available}, "
                     f"ubuntu={r.ubuntu_version}, old_version={old_version}"
                 )
-                store_update(conn, host, r.update, sample_time,
-                             r.kernel_needs_reboot, r.kernel_available, old_version)
+                writer.store(host, r.update, sample_time,
+                             r.kernel_needs_reboot, r.kernel_available, old_version, r.fingerprint)
                 processed += 1
             except KeyboardInterrupt:
                 update_tracker_logger.warning(f"Interrupted while waiting for {host}, continuing")
             except Exception as e:
                 update_tracker_logger.error(f"Failed to process {host}: {e}")
 
-    conn.close()
-    update_tracker_logger.info(f"Processed {processed} hosts, skipped {skipped} hosts")
+    pool.putconn(conn)
+    if writer.failed:
+        update_tracker_logger.error(f"Failed to store {writer.failed} hosts")
+    if writer.history_failed:
+        update_tracker_logger.error(f"Failed to record history of {writer.history_failed} samples")
+    update_tracker_logger.info(f"Processed {processed} hosts, {unchanged} unchanged, skipped {skipped} hosts")
 
 
 if __name__ == "__main__":
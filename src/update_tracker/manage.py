@@ -4,8 +4,7 @@ import datetime
 
 import psycopg
 
-from update_tracker import update_tracker_logger, postgres_connect, add_common_args, setup_logging, load_config
-from update_tracker.database import report
+from update_tracker import update_tracker_logger, connection_pool, add_common_args, setup_logging, load_config
 
 def delete_host(conn: psycopg.Connection, hostname: str) -> bool:
     """Delete a hostname from the database.
@@ -60,7 +59,8 @@ def main():
     args = parser.parse_args()
     setup_logging(args)
     config = load_config(args)
-    conn = postgres_connect(config)
+    pool = connection_pool(config)
+    conn = pool.getconn()
 
     # Handle delete operation
     if (hostname := args.delete):
@@ -81,7 +81,7 @@ def main():
             print(f"✗ Host {hostname} not found in database")
             update_tracker_logger.warning(f"Host {hostname} not found")
 
-    conn.close()
+    pool.putconn(conn)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,26 @@
 #!/usr/bin/env python3
 import argparse
 import datetime
+import queue
+import sys
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
 
 from mailer.email_template import EmailTemplate
 from nmrboxemail import SmtpMailer, Email
 from postgresql_access import DatabaseDict
 
-from update_tracker import update_tracker_logger, postgres_connect, HostSpec
+from update_tracker import update_tracker_logger, connection_pool, HostSpec
 from update_tracker import add_common_args, setup_logging, load_config, build_host_limits
+from update_tracker.database import notification_candidates
+
+MAIL_WORKERS = 4
+
+_SCHEDULE_SQL = '''
+    UPDATE audit.update_schedule us SET next_upgrade = %s
+    FROM unnest(%s::text[]) AS d(hostname)
+    WHERE us.hostname = d.hostname'''
 
 
 def next_upgrade_date() -> datetime.date:
@@ -18,110 +31,177 @@ def next_upgrade_date() -> datetime.date:
     return target
 
 
+def describe_action(overdue: bool, kernel_needs_reboot: bool, kernel_available: bool) -> str:
+    """What the scheduled upgrade will do, e.g. 'system updated and kernel updated'."""
+    actions = []
+    if overdue:
+        actions.append("system updated")
+    if kernel_needs_reboot:
+        actions.append("rebooted for new kernel")
+    elif kernel_available:
+        actions.append("kernel updated")
+    return " and ".join(actions)
+
+
+def digest_hosts(notices: list[tuple[str, str]]) -> str:
+    """Plain text list of (hostname, action) for a digest message, one host per line."""
+    return '\n'.join(f'{hostname}: {action}' for hostname, action in notices)
+
+
+class MailSender:
+    """Send emails from a bounded number of worker threads.
+
+    Each worker creates one SmtpMailer, from the same configuration as a single mailer
+    would use, and sends every message it takes through it for the rest of the run.
+    """
+
+    def __init__(self, config: dict, workers: int = MAIL_WORKERS):
+        self._config = config
+        self._queue: queue.Queue = queue.Queue()
+        self._workers = [threading.Thread(target=self._work, name=f'mail-{n}', daemon=True)
+                         for n in range(max(workers, 1))]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        """Send what is queued, then stop the workers."""
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def submit(self, email: Email) -> Future:
+        """Queue an email; the Future completes when it has been sent."""
+        future: Future = Future()
+        self._queue.put((future, email))
+        return future
+
+    def _work(self) -> None:
+        mailer: SmtpMailer | None = None
+        while (item := self._queue.get()) is not None:
+            future, email = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if mailer is None:
+                    mailer = SmtpMailer(self._config)
+                    mailer.reply = self._config['reply']
+                mailer.send(email)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+
 def main():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     add_common_args(parser)
     parser.add_argument('--dry-run', action='store_true',
                         help="Show what would be done without updating database or sending email")
+    parser.add_argument('--digest', action='store_true',
+                        help="Send each owner one message listing all of their hosts ('digest template'; "
+                             "its hosts field has one 'hostname: action' line per host)")
 
     args = parser.parse_args()
     setup_logging(args)
     config = load_config(args)
+    template_key = 'digest template' if args.digest else 'mail template'
+    if template_key not in config:
+        sys.exit(f"No '{template_key}' in the configuration")
 
     host_limits = build_host_limits(config)
 
     hs = HostSpec(host_limits=host_limits)
-    conn = postgres_connect(config)
+    pool = connection_pool(config)
+    conn = pool.getconn()
 
     db = DatabaseDict(dictionary=config['database'])
     template = EmailTemplate(db=db)
-    template_name = config['mail template']
-    mailer = SmtpMailer(config)
-    mailer.reply = config['reply']
+    template_name = config[template_key]
 
     upgrade_date = next_upgrade_date()
-    current_date = datetime.date.today()
-
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT hu.hostname, hu.last_update, hu.kernel_needs_reboot,
-               hu.kernel_available, hu.old_version, um.person_id
-        FROM audit.host_updates hu
-        LEFT JOIN audit.update_schedule us ON hu.hostname = us.hostname
-        LEFT JOIN audit.user_managed um ON hu.hostname = um.hostname
-        WHERE us.update_schedule IS NULL
-          AND um.next_upgrade IS NULL
-          AND um.person_id IS NOT NULL
-          AND NOT um.user_managed
-        ORDER BY hu.hostname
-    ''')
-    rows = cursor.fetchall()
-
-    processed = 0
-    for hostname, last_update, kernel_needs_reboot, kernel_available, old_version, person_id in rows:
-        if not hs.filter(hostname):
-            continue
-
-        update_limit = host_limits.get(hostname,0)
-
-        actions = []
-        if last_update is None or (current_date - last_update).days > update_limit:
-            actions.append("system updated")
-        if kernel_needs_reboot:
-            actions.append("rebooted for new kernel")
-        elif kernel_available:
-            actions.append("kernel updated")
-
-        if not old_version and not actions:
-            continue
-
-        action = " and ".join(actions)
-
-        person_cursor = conn.cursor()
-        person_cursor.execute(
-            "SELECT first_name, email FROM public.persons WHERE id = %s",
-            (person_id,)
-        )
-        person_row = person_cursor.fetchone()
-        if person_row is None:
-            update_tracker_logger.warning("No person found for person_id %s (host %s)", person_id, hostname)
-            continue
-        first_name, email_address = person_row
-        if old_version:
-            update_tracker_logger.warning(f"{first_name} {email_address} {hostname} old version")
-            continue
-
-        upgrade_dt = datetime.datetime.combine(upgrade_date, datetime.time(), tzinfo=datetime.timezone.utc)
-
-        data = {
-            'first_name': first_name,
-            'vmname': hostname,
-            'action': action,
-            'date': upgrade_date.strftime('%A, %B %d, %Y'),
-        }
-
-        subject, content = template.format(template_name, data)
-
-        print(f"{hostname}: notify {email_address}, scheduled {upgrade_date}, action: {action}")
-        update_tracker_logger.info(content)
-
-        if not args.dry_run:
-            email = Email(subject, content, to=(email_address,))
-            email.type = 'html'
-            mailer.send(email)
-
-            update_cursor = conn.cursor()
-            update_cursor.execute(
-                "UPDATE audit.update_schedule SET next_upgrade = %s WHERE hostname = %s",
-                (upgrade_dt, hostname)
-            )
+    upgrade_dt = datetime.datetime.combine(upgrade_date, datetime.time(), tzinfo=datetime.timezone.utc)
+    date = upgrade_date.strftime('%A, %B %d, %Y')
+
+    try:
+        rows = notification_candidates(conn, hs)
+        conn.commit()
+
+        people: dict[int, tuple[str, str]] = {}  # person_id -> (first_name, email)
+        notices: list[tuple[int, str, str]] = []  # (person_id, hostname, action) in hostname order
+        for (hostname, overdue, kernel_needs_reboot, kernel_available, old_version, person_id,
+             first_name, email_address) in rows:
+            if email_address is None:
+                update_tracker_logger.warning("No person found for person_id %s (host %s)", person_id, hostname)
+                continue
+            if old_version:
+                update_tracker_logger.warning(f"{first_name} {email_address} {hostname} old version")
+                continue
+            people[person_id] = (first_name, email_address)
+            notices.append((person_id, hostname, describe_action(overdue, kernel_needs_reboot, kernel_available)))
+
+        # each message with the hosts it schedules
+        messages: list[tuple[str, str, str, list[str]]] = []
+        if args.digest:
+            by_person: dict[int, list[tuple[str, str]]] = defaultdict(list)
+            for person_id, hostname, action in notices:
+                by_person[person_id].append((hostname, action))
+            for person_id, hosts in by_person.items():
+                first_name, email_address = people[person_id]
+                data = {'first_name': first_name, 'hosts': digest_hosts(hosts), 'date': date}
+                subject, content = template.format(template_name, data)
+                hostnames = [hostname for hostname, _ in hosts]
+                print(f"{email_address}: notify about {len(hostnames)} host(s), scheduled {upgrade_date}")
+                for hostname, action in hosts:
+                    print(f"    {hostname}: {action}")
+                messages.append((email_address, subject, content, hostnames))
+        else:
+            for person_id, hostname, action in notices:
+                first_name, email_address = people[person_id]
+                data = {'first_name': first_name, 'vmname': hostname, 'action': action, 'date': date}
+                subject, content = template.format(template_name, data)
+                print(f"{hostname}: notify {email_address}, scheduled {upgrade_date}, action: {action}")
+                messages.append((email_address, subject, content, [hostname]))
+
+        processed = 0
+        failed = 0
+        sends: dict[Future, list[str]] = {}
+        for _, _, content, _ in messages:
+            update_tracker_logger.info(content)
+        if args.dry_run:
+            processed = sum(len(hostnames) for *_, hostnames in messages)
+        elif messages:
+            with MailSender(config, config.get('mail workers', MAIL_WORKERS)) as sender:
+                for email_address, subject, content, hostnames in messages:
+                    email = Email(subject, content, to=(email_address,))
+                    email.type = 'html'
+                    sends[sender.submit(email)] = hostnames
+
+        # Schedule only hosts whose owner was actually told, in one transaction
+        delivered = []
+        for future, hostnames in sends.items():
+            try:
+                future.result()
+                delivered.extend(hostnames)
+            except Exception as e:
+                update_tracker_logger.error(f"{', '.join(hostnames)}: failed to send notice: {e}")
+                failed += len(hostnames)
+        if delivered:
+            conn.execute(_SCHEDULE_SQL, (upgrade_dt, delivered))
             conn.commit()
-
-        processed += 1
-
-    conn.close()
+        processed += len(delivered)
+    finally:
+        pool.putconn(conn)
     prefix = "[DRY RUN] " if args.dry_run else ""
-    print(f"\n{prefix}Processed {processed} host(s)")
+    print(f"\n{prefix}Processed {processed} host(s) in {len(messages)} message(s)")
+    if failed:
+        print(f"Failed to notify {failed} host(s)")
 
 
 if __name__ == "__main__":
@@ -1,14 +1,18 @@
 import configparser
-from dataclasses import dataclass
+import dataclasses
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Iterable
 
-from ansible.inventory.manager import InventoryManager
-from ansible.parsing.dataloader import DataLoader
-from ansible.vars.manager import VariableManager
-from ansible import context
-from ansible.module_utils.common.collections import ImmutableDict
-from ansible.inventory.host import Host
+from update_tracker import update_tracker_logger
+
+# Cached inventories older than this are re-parsed even if no source changed,
+# since dynamic inventory scripts can return new hosts without being modified
+CACHE_MAX_AGE = 24 * 3600
 
 
 @dataclass
@@ -17,15 +21,112 @@ class AnsibleInfo:
     keyfile: Path
     inventory: list[str]
 
-def query_ansible(config: Path, names: Iterable[str]) -> AnsibleInfo:
+
+@dataclass
+class Inventory(AnsibleInfo):
+    """AnsibleInfo for several inventory/group names, keeping each name's hosts."""
+    groups: dict[str, list[str]] = field(default_factory=dict)
+    # every Ansible inventory group (except all and ungrouped) -> its hosts among inventory,
+    # in inventory order
+    ansible_groups: dict[str, list[str]] = field(default_factory=dict)
+
+    def host_limits(self, cutoffs: dict) -> dict[str, int]:
+        """Per-host 'update days': the largest limit of any group the host is in."""
+        host_limits: dict[str, int] = {}
+        for name, hosts in self.groups.items():
+            update_days = cutoffs[name]['update days']
+            for host in hosts:
+                host_limits[host] = max(host_limits.get(host, update_days), update_days)
+        return host_limits
+
+
+def cache_dir() -> Path:
+    """Local directory for update_tracker caches."""
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'update_tracker'
+
+
+def _files(directory: Path) -> list[Path]:
+    return sorted(p for p in directory.rglob('*') if p.is_file())
+
+
+def _sources_digest(config: Path, inventory_path: Path) -> str:
+    """Digest of ansible.cfg contents and the size/mtime of every inventory source file.
+
+    Sources include the group_vars/ and host_vars/ files Ansible reads beside the
+    inventory, since they set the cached account and key file.
+    """
+    h = hashlib.sha256()
+    h.update(config.read_bytes() if config.exists() else b'')
+    if inventory_path.is_dir():
+        paths = _files(inventory_path)
+    else:
+        paths = [inventory_path]
+        for vars_dir in ('group_vars', 'host_vars'):
+            if (inventory_path.parent / vars_dir).is_dir():
+                paths.extend(_files(inventory_path.parent / vars_dir))
+    for p in paths:
+        try:
+            st = p.stat()
+            h.update(f'{p}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+        except OSError:
+            h.update(f'{p}\0missing\n'.encode())
+    return h.hexdigest()
+
+
+def _read_cache(cache_file: Path, sources: str) -> Inventory | None:
+    try:
+        with open(cache_file) as f:
+            data = json.load(f)
+        if data['sources'] != sources or time.time() - data['created'] > CACHE_MAX_AGE:
+            return None
+        info = data['info']
+        return Inventory(account=info['account'], keyfile=Path(info['keyfile']), inventory=info['inventory'],
+                         groups=info['groups'], ansible_groups=info['ansible_groups'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_cache(cache_file: Path, sources: str, info: Inventory) -> None:
+    data = {'sources': sources, 'created': time.time(), 'info': dataclasses.asdict(info)}
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        update_tracker_logger.warning(f"Could not write inventory cache {cache_file}: {e}")
+
+
+def load_inventory(config: dict) -> Inventory:
+    """Resolve every configured inventory name in one pass.
+
+    Args:
+        config: update_tracker configuration; uses ansible/config and ansible/inventory
+    """
+    a = config['ansible']
+    return query_ansible(a['config'], a['inventory'])
+
+
+def query_ansible(config: Path, names: Iterable[str]) -> Inventory:
     """
     List hosts for the given inventory/group name using Ansible's Python API.
 
+    All names are resolved from a single InventoryManager; the hosts of each name are
+    kept in Inventory.groups.
+
+    Results are cached under cache_dir() and reused until ansible.cfg or an inventory
+    source file changes (or the entry is older than CACHE_MAX_AGE), so Ansible is only
+    imported when the inventory actually has to be parsed.
+
     Args:
         config: Full path to ansible.cfg file
         names: The inventory or group name to query
     """
     #os.environ['ANSIBLE_CONFIG'] = str(config)
+    config = Path(config)
+    names = list(names)
 
     # Read the ansible.cfg to get configuration values
     ansible_config = configparser.ConfigParser()
@@ -37,6 +138,28 @@ def query_ansible(config: Path, names: Iterable[str]) -> AnsibleInfo:
     if not inventory_path.is_absolute():
         inventory_path = config.parent / inventory_path
 
+    key = hashlib.sha256(json.dumps([str(config.absolute()), names]).encode()).hexdigest()[:32]
+    cache_file = cache_dir() / f'inventory-{key}.json'
+    sources = _sources_digest(config, inventory_path)
+    if (cached := _read_cache(cache_file, sources)) is not None:
+        update_tracker_logger.debug(f"Inventory {names} from cache {cache_file}")
+        return cached
+
+    info = _load_ansible(config, ansible_config, inventory_path, names)
+    _write_cache(cache_file, sources, info)
+    return info
+
+
+def _load_ansible(config: Path, ansible_config: configparser.ConfigParser, inventory_path: Path,
+                  names: list[str]) -> Inventory:
+    """Parse the inventory with Ansible's Python API."""
+    from ansible.inventory.manager import InventoryManager
+    from ansible.parsing.dataloader import DataLoader
+    from ansible.vars.manager import VariableManager
+    from ansible import context
+    from ansible.module_utils.common.collections import ImmutableDict
+    from ansible.inventory.host import Host
+
     context.CLIARGS = ImmutableDict(
         connection='local',
         module_path=None,
@@ -54,13 +177,20 @@ def query_ansible(config: Path, names: Iterable[str]) -> AnsibleInfo:
     variable_manager = VariableManager(loader=loader, inventory=inventory)
 
     combined = {}
+    groups: dict[str, list[str]] = {}
     for name in names:
         hdata: Host
+        groups[name] = []
         for hdata in inventory.get_hosts(pattern=name):
-
+            groups[name].append(hdata.name)
             combined[hdata.name] = hdata
 
     host_list = list(combined.keys())
+    ansible_groups = {}
+    for group_name, group in inventory.groups.items():
+        if group_name in ('all', 'ungrouped'):
+            continue
+        ansible_groups[group_name] = [h.name for h in group.get_hosts() if h.name in combined]
 
     remote_user = ansible_config.get('defaults', 'remote_user', fallback='root')
     private_key_file = ansible_config.get('defaults', 'private_key_file', fallback='')
@@ -78,8 +208,10 @@ def query_ansible(config: Path, names: Iterable[str]) -> AnsibleInfo:
     else:
         private_key_path = Path()
 
-    return AnsibleInfo(
+    return Inventory(
         account=remote_user,
         keyfile=private_key_path,
-        inventory=host_list
+        inventory=host_list,
+        groups=groups,
+        ansible_groups=ansible_groups,
     )
@@ -1,86 +1,66 @@
 #!/usr/bin/env python3
 import argparse
+import csv
+import dataclasses
 import datetime
-
-from update_tracker import postgres_connect, HostSpec
-from update_tracker.database import report
+import itertools
+import json
+import operator
+import sys
+from typing import Iterable
+
+from update_tracker import connection_pool, HostSpec
+from update_tracker.database import iter_issues, Issue, CATEGORIES, NEVER_UPDATED, UPDATE_OLD, \
+    KERNEL_NEEDS_REBOOT, KERNEL_AVAILABLE, OLD_VERSION
 from update_tracker import add_common_args, setup_logging, load_config, build_host_limits
 
-def main():
-    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-    add_common_args(parser)
-    parser.add_argument('--all', dest='show_all', action='store_true',
-                        help="Include hosts that have a regular update schedule (suppressed by default)")
+# Heading shown before a category's hosts, and the line shown when it has none
+_SECTIONS = {
+    NEVER_UPDATED: ("Servers never updated:", "No servers without update history"),
+    UPDATE_OLD: ("Servers with outdated updates:", "No servers with outdated updates"),
+    KERNEL_NEEDS_REBOOT: ("Servers with newer kernel installed (reboot required):",
+                          "No servers requiring kernel reboot"),
+    KERNEL_AVAILABLE: ("Servers with kernel update available:", "No servers with kernel updates pending"),
+    OLD_VERSION: ("Servers running Ubuntu older than {current_ubuntu}:", "No servers with outdated Ubuntu version"),
+}
 
-    args = parser.parse_args()
-    setup_logging(args)
-    config = load_config(args)
-    a = config['ansible']
-    c = config['cutoffs']
+CSV_FIELDS = [f.name for f in dataclasses.fields(Issue)]
 
-    host_limits = build_host_limits(config)
 
-    conn = postgres_connect(config)
-    current_time = datetime.datetime.now(datetime.timezone.utc)
-
-    hs = HostSpec(host_limits=host_limits)
-
-    issues = report(conn, hs, show_all=args.show_all)
-    conn.close()
-
-    # Display results
+def print_text(stream: Iterable[Issue], config: dict, current_time: datetime.datetime) -> None:
+    """Print the human-readable report, one section per category, as rows arrive."""
+    a = config['ansible']
+    c = config['cutoffs']
     print("=" * 70)
     print("UPDATE TRACKER REPORT")
     print(f"Generated: {current_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
     for inv_name in a['inventory']:
         inv_limits = c[inv_name]
         print(f"  {inv_name}: update={inv_limits['update days']}d")
-    print("=" * 70)
-
-    # Display never updated servers
-    if issues.never_updated:
-        print(f"\n⚠️  Servers never updated:")
-        for hostname in sorted(issues.never_updated):
-            print(f"  • {hostname}")
-    else:
-        print(f"\n✓ No servers without update history")
-
-    # Display outdated update issues
-    if issues.update_old:
-        print(f"\n⚠️  Servers with outdated updates:")
-        for hostname, last_update_date, days_since in sorted(issues.update_old, key=lambda x: x[2], reverse=True):
-            update_limit = host_limits.get(hostname, 0)
-            print(f"  • {hostname}: last updated {last_update_date} ({days_since} days ago, limit: {update_limit})")
-    else:
-        print(f"\n✓ No servers with outdated updates")
-
-    # Display kernel reboot needed
-    if issues.kernel_needs_reboot:
-        print(f"\n⚠️  Servers with newer kernel installed (reboot required):")
-        for hostname in sorted(issues.kernel_needs_reboot):
-            print(f"  • {hostname}")
-    else:
-        print(f"\n✓ No servers requiring kernel reboot")
-
-    # Display kernel update available
-    if issues.kernel_available:
-        print(f"\n⚠️  Servers with kernel update available:")
-        for hostname in sorted(issues.kernel_available):
-            print(f"  • {hostname}")
-    else:
-        print(f"\n✓ No servers with kernel updates pending")
-
-    # Display old Ubuntu version
-    current_ubuntu = config.get('current ubuntu')
-    if issues.old_version:
-        print(f"\n⚠️  Servers running Ubuntu older than {current_ubuntu}:")
-        for hostname in sorted(issues.old_version):
-            print(f"  • {hostname}")
-    else:
-        print(f"\n✓ No servers with outdated Ubuntu version")
+    print("=" * 70, flush=True)
+
+    def none_found(category: str):
+        print(f"\n✓ {_SECTIONS[category][1]}")
+
+    # Rows arrive grouped in CATEGORIES order, so a category missing from the stream
+    # is reported as clean when the next one starts (or at the end)
+    total_issues = 0
+    pending = iter(CATEGORIES)
+    for category, group in itertools.groupby(stream, key=operator.attrgetter('category')):
+        for skipped in itertools.takewhile(lambda p: p != category, pending):
+            none_found(skipped)
+        print(f"\n⚠️  {_SECTIONS[category][0].format(current_ubuntu=config.get('current ubuntu'))}")
+        for issue in group:
+            total_issues += 1
+            if category == UPDATE_OLD:
+                print(f"  • {issue.hostname}: last updated {issue.last_update} "
+                      f"({issue.days_since} days ago, limit: {issue.update_limit})", flush=True)
+            else:
+                print(f"  • {issue.hostname}", flush=True)
+    for skipped in pending:
+        none_found(skipped)
 
     # Summary
-    total_issues = issues.total
     print("\n" + "=" * 70)
     if total_issues > 0:
         print(f"TOTAL: {total_issues} server(s) require attention")
@@ -89,5 +69,52 @@ def main():
     print("=" * 70)
 
 
+def print_ndjson(stream: Iterable[Issue]) -> None:
+    """One JSON object per issue."""
+    for issue in stream:
+        print(json.dumps(dataclasses.asdict(issue), default=str), flush=True)
+
+
+def print_csv(stream: Iterable[Issue]) -> None:
+    """CSV with a header row, one line per issue."""
+    writer = csv.writer(sys.stdout)
+    writer.writerow(CSV_FIELDS)
+    for issue in stream:
+        writer.writerow(dataclasses.astuple(issue))
+        sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    add_common_args(parser)
+    parser.add_argument('--all', dest='show_all', action='store_true',
+                        help="Include hosts that have a regular update schedule (suppressed by default)")
+    parser.add_argument('--format', choices=('text', 'ndjson', 'csv'), default='text',
+                        help="Output format; ndjson and csv emit one record per host and category")
+
+    args = parser.parse_args()
+    setup_logging(args)
+    config = load_config(args)
+
+    host_limits = build_host_limits(config)
+
+    pool = connection_pool(config)
+    conn = pool.getconn()
+    current_time = datetime.datetime.now(datetime.timezone.utc)
+
+    hs = HostSpec(host_limits=host_limits)
+
+    try:
+        stream = iter_issues(conn, hs, show_all=args.show_all)
+        if args.format == 'ndjson':
+            print_ndjson(stream)
+        elif args.format == 'csv':
+            print_csv(stream)
+        else:
+            print_text(stream, config, current_time)
+    finally:
+        pool.putconn(conn)
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,73 @@
+"""Plan fleet upgrades as a canary wave followed by fixed-size waves."""
+from dataclasses import dataclass
+
+
+@dataclass
+class RolloutPolicy:
+    """How update runs hosts: in waves, each gated on the one before."""
+    wave_size: int = 10
+    canary: int = 1                  # hosts in the first wave, when there is no canary group
+    canary_group: str | None = None  # Ansible group whose selected hosts form the first wave
+    min_success: float = 0.9         # a later wave below this success rate stops the rollout
+    max_failures: int | None = None  # failures in total that stop the rollout; None for no limit
+
+
+@dataclass
+class RolloutPlan:
+    waves: list[list[str]]
+    canary: bool  # waves[0] is the canary wave; False when no host was chosen for one
+
+
+def plan_waves(hosts: list[str], groups: dict[str, list[str]], policy: RolloutPolicy) -> RolloutPlan:
+    """Split hosts into waves.
+
+    The first wave is the canary: the hosts in policy.canary_group, or else the first
+    policy.canary hosts. There is no canary wave if that selects no hosts. The rest
+    follow in inventory group order (hosts in no group last), so each wave of
+    policy.wave_size mostly stays within one group.
+
+    Args:
+        hosts: hosts to upgrade
+        groups: Ansible inventory group name -> hosts, as Inventory.ansible_groups
+        policy: wave sizes
+    Raises:
+        ValueError: canary_group is not an Ansible inventory group
+    """
+    order = {}
+    for index, members in enumerate(groups.values()):
+        for host in members:
+            order.setdefault(host, index)
+    remaining = sorted(hosts, key=lambda h: (order.get(h, len(groups)), h))
+
+    if policy.canary_group is not None:
+        if policy.canary_group not in groups:
+            raise ValueError(f"Canary group {policy.canary_group} is not in the inventory")
+        members = set(groups[policy.canary_group])
+        canary = [h for h in remaining if h in members]
+        remaining = [h for h in remaining if h not in members]
+    else:
+        canary, remaining = remaining[:policy.canary], remaining[policy.canary:]
+
+    waves = [canary] if canary else []
+    size = max(policy.wave_size, 1)
+    waves.extend(remaining[i:i + size] for i in range(0, len(remaining), size))
+    return RolloutPlan(waves, canary=bool(canary))
+
+
+def stop_reason(policy: RolloutPolicy, canary: bool, succeeded: int, failed: int,
+                total_failed: int) -> str | None:
+    """Why the rollout should stop after a wave, or None to go on.
+
+    Args:
+        canary: the wave was the canary, which must succeed on every host
+        succeeded: hosts in the wave that upgraded
+        failed: hosts in the wave that did not
+        total_failed: failures so far in the rollout, this wave included
+    """
+    if policy.max_failures is not None and total_failed >= policy.max_failures:
+        return f"{total_failed} failure(s) reached the limit of {policy.max_failures}"
+    if canary and failed:
+        return f"canary wave had {failed} failure(s)"
+    if failed and succeeded / (succeeded + failed) < policy.min_success:
+        return f"wave success rate {succeeded / (succeeded + failed):.0%} is below {policy.min_success:.0%}"
+    return None
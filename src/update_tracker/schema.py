@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Create and migrate the audit schema, and check queries against its indexes."""
+import argparse
+import datetime
+import json
+import re
+import sys
+from dataclasses import dataclass, field
+
+import psycopg
+from psycopg import sql
+
+from update_tracker import update_tracker_logger, connection_pool, HostSpec, add_common_args, setup_logging, load_config
+
+# Ordered (version, description, sql). Statements are idempotent so a database created
+# by hand before the schema was managed can be brought under version control.
+# Append new migrations; never edit one that has been released.
+MIGRATIONS: list[tuple[int, str, str]] = [
+    (1, 'base tables', '''
+        CREATE SCHEMA IF NOT EXISTS audit;
+        CREATE TABLE IF NOT EXISTS audit.host_updates (
+            hostname text PRIMARY KEY,
+            last_update date,
+            sample_time timestamptz,
+            kernel_needs_reboot boolean NOT NULL DEFAULT false,
+            kernel_available boolean NOT NULL DEFAULT false,
+            old_version boolean NOT NULL DEFAULT false
+        );
+        CREATE TABLE IF NOT EXISTS audit.update_schedule (
+            hostname text PRIMARY KEY,
+            update_schedule text,
+            next_upgrade timestamptz
+        );
+        CREATE TABLE IF NOT EXISTS audit.user_managed (
+            hostname text PRIMARY KEY,
+            person_id integer,
+            user_managed boolean NOT NULL DEFAULT false,
+            next_upgrade timestamptz
+        );
+        CREATE TABLE IF NOT EXISTS audit.conffile_choices (
+            hostname text NOT NULL,
+            conffile text NOT NULL,
+            choice text NOT NULL,
+            recorded_at timestamptz NOT NULL DEFAULT now(),
+            PRIMARY KEY (hostname, conffile)
+        );
+    '''),
+    (2, 'probe fingerprint', '''
+        ALTER TABLE audit.host_updates ADD COLUMN IF NOT EXISTS fingerprint text;
+    '''),
+    (3, 'indexes for report, update and notify queries', '''
+        -- update.get_kernel_issues
+        CREATE INDEX IF NOT EXISTS host_updates_kernel_idx ON audit.host_updates (hostname)
+            WHERE kernel_needs_reboot OR kernel_available;
+        -- hosts ordered or ranged by last update (manage, ad hoc reporting)
+        CREATE INDEX IF NOT EXISTS host_updates_last_update_idx ON audit.host_updates (last_update);
+        -- scheduled-host suppression in database.HOSTS_CTE
+        CREATE INDEX IF NOT EXISTS update_schedule_scheduled_idx ON audit.update_schedule (hostname)
+            WHERE update_schedule IS NOT NULL;
+        -- notify_upgrade: owner lookups; hostname joins use the primary keys
+        CREATE INDEX IF NOT EXISTS user_managed_person_idx ON audit.user_managed (person_id)
+            WHERE person_id IS NOT NULL;
+    '''),
+    (4, 'sample history', '''
+        -- every scan sample, appended by writer.ResultWriter; monthly partitions are
+        -- created and expired by maintain_sample_partitions
+        CREATE TABLE IF NOT EXISTS audit.host_update_samples (
+            hostname text NOT NULL,
+            sample_time timestamptz NOT NULL,
+            last_update date,
+            kernel_needs_reboot boolean,
+            kernel_available boolean,
+            old_version boolean,
+            fingerprint text
+        ) PARTITION BY RANGE (sample_time);
+        CREATE INDEX IF NOT EXISTS host_update_samples_host_idx
+            ON audit.host_update_samples (hostname, sample_time);
+    '''),
+    (5, 'unknown kernel and version state', '''
+        -- NULL when the probe could not tell
+        ALTER TABLE audit.host_updates
+            ALTER COLUMN kernel_needs_reboot DROP NOT NULL,
+            ALTER COLUMN kernel_needs_reboot DROP DEFAULT,
+            ALTER COLUMN kernel_available DROP NOT NULL,
+            ALTER COLUMN kernel_available DROP DEFAULT,
+            ALTER COLUMN old_version DROP NOT NULL,
+            ALTER COLUMN old_version DROP DEFAULT;
+    '''),
+]
+
+SAMPLE_RETENTION_MONTHS = 24
+_SAMPLE_PARTITION = re.compile(r'host_update_samples_(\d{4})(\d{2})$')
+
+_VERSION_TABLE = '''
+    CREATE SCHEMA IF NOT EXISTS audit;
+    CREATE TABLE IF NOT EXISTS audit.schema_version (
+        version integer PRIMARY KEY,
+        description text NOT NULL,
+        applied_at timestamptz NOT NULL DEFAULT now()
+    )
+'''
+
+
+def current_version(conn: psycopg.Connection) -> int:
+    """Highest applied migration, 0 for an unmanaged database."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('audit.schema_version') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute('SELECT coalesce(max(version), 0) FROM audit.schema_version')
+    return cursor.fetchone()[0]
+
+
+def has_column(conn: psycopg.Connection, table: str, column: str) -> bool:
+    """True if table (schema-qualified) exists and has column."""
+    cursor = conn.cursor()
+    cursor.execute('''SELECT EXISTS (SELECT 1 FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = %s AND attnum > 0 AND NOT attisdropped)''',
+                   (table, column))
+    found = cursor.fetchone()[0]
+    conn.rollback()
+    return found
+
+
+def migrate(conn: psycopg.Connection, dry_run: bool = False) -> list[int]:
+    """Apply pending migrations in order, each in its own transaction.
+
+    Returns:
+        versions applied (or that would be applied, for dry_run)
+    """
+    cursor = conn.cursor()
+    if not dry_run:
+        cursor.execute(_VERSION_TABLE)
+        conn.commit()
+    applied = []
+    for version, description, sql in MIGRATIONS:
+        # re-read inside the loop's transaction: the lock serializes concurrent migrators
+        if not dry_run:
+            cursor.execute('LOCK TABLE audit.schema_version IN EXCLUSIVE MODE')
+        if version <= current_version(conn):
+            conn.rollback()
+            continue
+        if dry_run:
+            print(f"-- {version}: {description}{sql}")
+        else:
+            update_tracker_logger.info(f"Applying schema migration {version}: {description}")
+            cursor.execute(sql)
+            cursor.execute('INSERT INTO audit.schema_version (version, description) VALUES (%s, %s)',
+                           (version, description))
+            conn.commit()
+        applied.append(version)
+    conn.rollback()
+    return applied
+
+
+def _add_months(month: datetime.date, n: int) -> datetime.date:
+    year, index = divmod(month.month - 1 + n, 12)
+    return datetime.date(month.year + year, index + 1, 1)
+
+
+def maintain_sample_partitions(conn: psycopg.Connection, today: datetime.date,
+                               retention_months: int | None = SAMPLE_RETENTION_MONTHS) -> bool:
+    """Create this and next month's audit.host_update_samples partitions and drop expired ones.
+
+    Partitions are only created when missing, so a routine call takes no lock on the
+    parent table.
+
+    Args:
+        conn: Database connection
+        today: date in the newest month that must be writable
+        retention_months: drop partitions that ended more than this many months before
+                          today's month; None keeps everything
+
+    Returns:
+        False if the history table does not exist (schema migration 4 not applied)
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT to_regclass('audit.host_update_samples') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        conn.rollback()
+        update_tracker_logger.warning("audit.host_update_samples does not exist; run schema to record history")
+        return False
+
+    this_month = today.replace(day=1)
+    for start in (this_month, _add_months(this_month, 1)):
+        name = f'host_update_samples_{start:%Y%m}'
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (f'audit.{name}',))
+        if cursor.fetchone()[0]:
+            continue
+        update_tracker_logger.info(f"Creating partition audit.{name}")
+        cursor.execute(sql.SQL(
+            'CREATE TABLE {} PARTITION OF audit.host_update_samples FOR VALUES FROM ({}) TO ({})').format(
+            sql.Identifier('audit', name),
+            sql.Literal(f'{start} 00:00+00'), sql.Literal(f'{_add_months(start, 1)} 00:00+00')))
+
+    if retention_months is not None:
+        oldest = _add_months(this_month, -retention_months)
+        cursor.execute('''SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'audit.host_update_samples'::regclass''')
+        for (name,) in cursor.fetchall():
+            if (m := _SAMPLE_PARTITION.match(name)) is None:
+                continue
+            if _add_months(datetime.date(int(m[1]), int(m[2]), 1), 1) <= oldest:
+                update_tracker_logger.info(f"Dropping expired partition audit.{name}")
+                cursor.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier('audit', name)))
+    conn.commit()
+    return True
+
+
+@dataclass
+class QueryCheck:
+    """A query the tools run, with parameters representative of production."""
+    name: str
+    sql: str
+    params: dict | tuple = ()
+    # tables the query must read in full by design, e.g. fleet-wide classification
+    full_scan: set[str] = field(default_factory=set)
+
+
+def query_checks() -> list[QueryCheck]:
+    from update_tracker.database import (CATEGORIES, ISSUES_SQL, KERNEL_ISSUES_SQL, NOTIFY_SQL, PREFETCH_SQL,
+                                         hosts_params)
+
+    hosts = hosts_params(HostSpec(host_limits={'example': 7}))
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=24)
+    return [
+        QueryCheck('report issues', ISSUES_SQL, hosts | {'categories': list(CATEGORIES)}, {'host_updates'}),
+        QueryCheck('notify candidates', NOTIFY_SQL, hosts | {'show_all': True}, {'host_updates'}),
+        QueryCheck('scan prefetch', PREFETCH_SQL, (cutoff, cutoff), {'host_updates'}),
+        QueryCheck('kernel issues', KERNEL_ISSUES_SQL),
+        QueryCheck('single host', 'SELECT hostname FROM audit.host_updates WHERE hostname = %s', ('example',)),
+        QueryCheck('conffile choices', 'SELECT conffile, choice FROM audit.conffile_choices WHERE hostname = %s',
+                   ('example',)),
+        QueryCheck('host history', '''SELECT sample_time, kernel_needs_reboot, kernel_available
+            FROM audit.host_update_samples WHERE hostname = %s AND sample_time >= %s''', ('example', cutoff)),
+        QueryCheck('scheduled hosts',
+                   'SELECT hostname FROM audit.update_schedule WHERE update_schedule IS NOT NULL'),
+    ]
+
+
+def _full_scans(plan: dict) -> list[str]:
+    """Relations a plan reads in full: sequential scans, and index scans that walk the
+    whole index only to filter rows (what the planner does when seq scans are off)."""
+    full = plan['Node Type'] == 'Seq Scan' or (
+        plan['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Filter' in plan and 'Index Cond' not in plan)
+    scans = [plan['Relation Name']] if full else []
+    for child in plan.get('Plans', []):
+        scans.extend(_full_scans(child))
+    return scans
+
+
+def check_queries(conn: psycopg.Connection) -> list[str]:
+    """EXPLAIN every QueryCheck and return the unexpected full-table reads.
+
+    Sequential scans are disabled while planning, since small tables would otherwise
+    always be seq scanned; a full read left in a plan means no index serves that access.
+    """
+    problems = []
+    cursor = conn.cursor()
+    for check in query_checks():
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {check.sql}', check.params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        unexpected = sorted(set(_full_scans(plan[0]['Plan'])) - check.full_scan)
+        if unexpected:
+            problems.append(f"{check.name}: sequential scan of {', '.join(unexpected)}")
+            print(f"✗ {problems[-1]}")
+        else:
+            print(f"✓ {check.name}")
+        conn.rollback()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter, description=__doc__)
+    add_common_args(parser)
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--dry-run', action='store_true', help="Print pending migrations without applying them")
+    group.add_argument('--check', action='store_true',
+                       help="Report queries that would fall back to a sequential scan")
+
+    args = parser.parse_args()
+    setup_logging(args)
+    config = load_config(args)
+    pool = connection_pool(config)
+    conn = pool.getconn()
+    try:
+        if args.check:
+            if check_queries(conn):
+                sys.exit(1)
+            return
+        applied = migrate(conn, dry_run=args.dry_run)
+        if not args.dry_run:
+            maintain_sample_partitions(conn, datetime.date.today(),
+                                       config.get('sample retention months', SAMPLE_RETENTION_MONTHS))
+        prefix = "[DRY RUN] " if args.dry_run else ""
+        if applied:
+            print(f"{prefix}Applied migration(s) {', '.join(map(str, applied))}")
+        else:
+            print(f"Schema is current (version {current_version(conn)})")
+    finally:
+        pool.putconn(conn)
+
+
+if __name__ == "__main__":
+    main()
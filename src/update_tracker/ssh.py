@@ -0,0 +1,199 @@
+import asyncio
+import shutil
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+
+from update_tracker import SshUser, update_tracker_logger
+
+EXIT_TIMEOUT = 10  # seconds allowed for closing a master
+
+# stdio for starting and closing masters; must not be pipes: a backgrounded master would hold them open
+_MASTER_STDIO = dict(stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+class SshPool:
+    """Keep one multiplexed ssh master connection open per host while it is worked on.
+
+    Every command sent through the pool rides the host's master session (OpenSSH
+    ControlMaster), so key exchange and authentication happen once per host instead
+    of once per command. If a master cannot be started, commands fall back to
+    ordinary direct connections. Call forget when a host's work is done so its master
+    does not stay open for the rest of the run.
+    """
+
+    def __init__(self, ssh_user: SshUser, timeout: int, persist: int = 600):
+        """
+        Args:
+            ssh_user: account and private key used for every connection
+            timeout: ssh ConnectTimeout in seconds
+            persist: seconds an idle master stays open (ControlPersist)
+        """
+        self.account = ssh_user.account
+        self.keyfile = ssh_user.keyfile
+        self.timeout = timeout
+        self.persist = persist
+        self._control_dir: Path | None = None
+        self._masters: set[str] = set()  # hosts with a running master
+        self._direct: set[str] = set()   # hosts whose master did not start
+        self._host_locks: dict[str, threading.Lock] = {}
+        self._async_host_locks: dict[str, asyncio.Lock] = {}  # for ensure_master_async, on one event loop
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def _control_path(self) -> Path:
+        with self._lock:
+            if self._control_dir is None:
+                # short path: unix socket names are limited to ~100 characters
+                self._control_dir = Path(tempfile.mkdtemp(prefix='ut-ssh-'))
+            return self._control_dir
+
+    def options(self) -> list[str]:
+        """ssh/scp options routing connections through the pool's control sockets."""
+        return [
+            '-i', str(self.keyfile),
+            '-o', f'ConnectTimeout={self.timeout}',
+            '-o', 'ServerAliveInterval=5',
+            '-o', 'ServerAliveCountMax=3',
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            # ControlMaster defaults to no: use the host's master when one is running
+            '-o', f'ControlPath={self._control_path()}/%C',
+        ]
+
+    def target(self, hostname: str) -> str:
+        return f'{self.account}@{hostname}'
+
+    def master_command(self, hostname: str) -> list[str]:
+        """Command that starts a background master session for hostname."""
+        return ['ssh', '-o', 'ControlMaster=yes'] + self.options() + [
+            '-o', f'ControlPersist={self.persist}',
+            '-f', '-N', self.target(hostname),
+        ]
+
+    def master_started(self, hostname: str, ok: bool) -> None:
+        """Record the outcome of running master_command for hostname."""
+        with self._lock:
+            (self._masters if ok else self._direct).add(hostname)
+        if not ok:
+            update_tracker_logger.debug(f"{hostname}: no ssh master, using direct connections")
+
+    def needs_master(self, hostname: str) -> bool:
+        with self._lock:
+            return hostname not in self._masters and hostname not in self._direct
+
+    def ensure_master(self, hostname: str, timeout: float | None = None) -> None:
+        """Start the master session for hostname unless one was already attempted."""
+        with self._lock:
+            host_lock = self._host_locks.setdefault(hostname, threading.Lock())
+        with host_lock:
+            if not self.needs_master(hostname):
+                return
+            try:
+                result = subprocess.run(self.master_command(hostname), timeout=self._master_timeout(timeout),
+                                        **_MASTER_STDIO)
+                ok = result.returncode == 0
+            except subprocess.TimeoutExpired:
+                ok = False
+            self.master_started(hostname, ok)
+
+    async def ensure_master_async(self, hostname: str, timeout: float | None = None) -> None:
+        """ensure_master for an asyncio event loop."""
+        host_lock = self._async_host_locks.setdefault(hostname, asyncio.Lock())
+        async with host_lock:
+            if not self.needs_master(hostname):
+                return
+            proc = await asyncio.create_subprocess_exec(*self.master_command(hostname), **_MASTER_STDIO)
+            try:
+                ok = await asyncio.wait_for(proc.wait(), self._master_timeout(timeout)) == 0
+            except asyncio.TimeoutError:
+                ok = False
+            finally:
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+            self.master_started(hostname, ok)
+
+    def _master_timeout(self, timeout: float | None) -> float:
+        return timeout or self.timeout + 5
+
+    def command(self, hostname: str, remote: str, start_master: bool = True) -> list[str]:
+        """Return the ssh argument list that runs remote on hostname over its master.
+
+        Args:
+            hostname: remote host
+            remote: shell command line to run there
+            start_master: start the master session first (blocking) if not yet attempted
+        """
+        if start_master:
+            self.ensure_master(hostname)
+        return ['ssh'] + self.options() + [self.target(hostname), remote]
+
+    def run(self, hostname: str, remote: str, timeout: float | None = None,
+            **kwargs) -> subprocess.CompletedProcess:
+        """subprocess.run remote on hostname, capturing text output."""
+        if timeout is None:
+            timeout = self.timeout + 5
+        return subprocess.run(self.command(hostname, remote), capture_output=True, text=True,
+                              timeout=timeout, **kwargs)
+
+    def popen(self, hostname: str, remote: str, **kwargs) -> subprocess.Popen:
+        """subprocess.Popen remote on hostname."""
+        return subprocess.Popen(self.command(hostname, remote), **kwargs)
+
+    def forget(self, hostname: str) -> None:
+        """Close hostname's master once its work is done (or before a reboot drops the connection)."""
+        if (command := self._release(hostname)) is not None:
+            self._exit_master(command, hostname)
+
+    async def forget_async(self, hostname: str) -> None:
+        """forget for an asyncio event loop."""
+        if (command := self._release(hostname)) is None:
+            return
+        proc = await asyncio.create_subprocess_exec(*command, **_MASTER_STDIO)
+        try:
+            await asyncio.wait_for(proc.wait(), EXIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            update_tracker_logger.warning(f"{hostname}: timed out closing ssh master")
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+    def _release(self, hostname: str) -> list[str] | None:
+        """Stop tracking hostname; returns the command that closes its master, if one is running."""
+        with self._lock:
+            self._direct.discard(hostname)
+            if hostname not in self._masters:
+                return None
+            self._masters.discard(hostname)
+            return self._exit_command(self._control_dir, hostname)
+
+    def _exit_command(self, control_dir: Path, hostname: str) -> list[str]:
+        return ['ssh', '-o', f'ControlPath={control_dir}/%C', '-O', 'exit', self.target(hostname)]
+
+    def _exit_master(self, command: list[str], hostname: str) -> None:
+        try:
+            subprocess.run(command, timeout=EXIT_TIMEOUT, **_MASTER_STDIO)
+        except subprocess.TimeoutExpired:
+            update_tracker_logger.warning(f"{hostname}: timed out closing ssh master")
+
+    def close(self) -> None:
+        """Shut down every master still running and remove the control socket directory."""
+        with self._lock:
+            hosts = sorted(self._masters)
+            self._masters.clear()
+            self._direct.clear()
+            control_dir, self._control_dir = self._control_dir, None
+        if control_dir is None:
+            return
+        for hostname in hosts:
+            self._exit_master(self._exit_command(control_dir, hostname), hostname)
+        shutil.rmtree(control_dir, ignore_errors=True)
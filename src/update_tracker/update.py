@@ -2,34 +2,42 @@
 import argparse
 import concurrent.futures
 import datetime
+import logging
 import os
 import queue
 import re
 import select
 import subprocess
+import sys
 import threading
 import time
+from collections import deque
 from pathlib import Path
 
 import psycopg
 
-from update_tracker import postgres_connect, update_tracker_logger, HostLimit, HostSpec, add_common_args, setup_logging, load_config, build_host_limits
-from update_tracker.query import query_ansible
+from update_tracker import connection_pool, update_tracker_logger, HostLimit, HostSpec, SshUser, add_common_args, setup_logging, load_config, build_host_limits
+from update_tracker.database import KERNEL_ISSUES_SQL
+from update_tracker.query import load_inventory
+from update_tracker.rollout import RolloutPolicy, plan_waves, stop_reason
+from update_tracker.ssh import SshPool
 
 REBOOT_TIMEOUT = 300      # seconds to wait for host to come back
 POLL_INTERVAL = 15        # seconds between SSH reconnect attempts
 SHUTDOWN_WAIT = 30        # seconds to wait before polling (let host start rebooting)
 APT_UPGRADE_TIMEOUT = 600 # seconds for apt-get upgrade to complete
+TAIL_BYTES = 2048         # apt output kept for failure messages
+MAX_LINE_BYTES = 65536    # an unterminated line longer than this is scanned in pieces
 
 # apt output patterns that indicate manual intervention is required
-_MANUAL_INTERVENTION_PATTERNS = [
-    'dpkg was interrupted',
-    'dpkg --configure',
-    'apt --fix-broken',
-    'unmet dependencies',
-    'held broken packages',
-    'requires manual',
-]
+_MANUAL_INTERVENTION_PATTERNS = (
+    b'dpkg was interrupted',
+    b'dpkg --configure',
+    b'apt --fix-broken',
+    b'unmet dependencies',
+    b'held broken packages',
+    b'requires manual',
+)
 
 def _ssh_opts(keyfile: Path, timeout: int) -> list[str]:
     return [
@@ -77,12 +85,7 @@ def monitor_reboot(hostname: str, account: str, keyfile: Path, results: dict):
 def get_kernel_issues(conn: psycopg.Connection) -> list[tuple[str, bool, bool]]:
     """Return hosts with kernel issues as (hostname, needs_reboot, available)."""
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT hostname, kernel_needs_reboot, kernel_available
-        FROM audit.host_updates
-        WHERE kernel_needs_reboot = true OR kernel_available = true
-        ORDER BY hostname
-    ''')
+    cursor.execute(KERNEL_ISSUES_SQL)
     return [(row[0], bool(row[1]), bool(row[2])) for row in cursor.fetchall()]
 
 
@@ -137,127 +140,207 @@ def do_kernel(conn: psycopg.Connection, account: str, keyfile: Path, timeout: in
                 print(f"  {hostname}: ERROR - did not respond within {REBOOT_TIMEOUT}s")
 
 
-_CONFFILE_PROMPT = re.compile(r'\*\*\* (\S+) \(Y/I/N/O/D/Z\)')
-_CONFIG_FILE_RE = re.compile(r"Configuration file '(.+?)'")
-# Queue item: (hostname, conffile_path, response_event, response_holder)
-ConffilePrompt = tuple[str, str, threading.Event, list]
+_CONFFILE_PROMPT = re.compile(rb'\*\*\* (\S+) \(Y/I/N/O/D/Z\)')
+_CONFIG_FILE_RE = re.compile(rb"Configuration file '(.+?)'")
+_KEPT_BACK_PATTERNS = (b'kept back', b'not upgraded')
 
 
-def run_apt_upgrade(hostname: str, account: str, keyfile: Path, timeout: int,
-                    conffile_choices: dict[str, str] | None = None,
-                    prompt_queue: queue.Queue | None = None) -> tuple[bool, str]:
-    """Run apt-get update (subprocess.run) then apt-get -y upgrade (Popen).
+class AptOutput:
+    """Scan apt-get upgrade output incrementally.
 
-    When a dpkg conffile prompt appears:
-    - If conffile_choices has a stored answer, use it automatically.
-    - Otherwise, put a ConffilePrompt on prompt_queue and block until the
-      main thread answers (or respond N if no queue is provided).
-    Returns (success, message).
+    Raw bytes are fed in as they arrive. Only the unterminated last line and the final
+    TAIL_BYTES of output are held; the patterns run_apt_upgrade reports on are recorded
+    as flags, so memory does not grow with the amount dpkg prints.
     """
-    # Step 1: refresh package cache
-    update_result = subprocess.run(
-        ['ssh'] + _ssh_opts(keyfile, timeout) + [
-            f'{account}@{hostname}',
-            'DEBIAN_FRONTEND=noninteractive /usr/bin/sudo apt-get update -qq',
-        ],
-        capture_output=True, text=True, timeout=timeout + 5,
-    )
-    if update_result.returncode != 0:
-        detail = update_result.stderr.strip() or f"exit {update_result.returncode}"
-        return False, f"apt-get update failed: {detail}"
-
-    # Step 2: upgrade packages, streaming output via Popen
-    proc = subprocess.Popen(
-        ['ssh'] + _ssh_opts(keyfile, timeout) + [
-            f'{account}@{hostname}',
-            'DEBIAN_FRONTEND=noninteractive /usr/bin/sudo apt-get -y upgrade --allow-downgrades',
-        ],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-    )
-
-    output_lines: list[str] = []
-    buf = ''
-    last_conffile_path: str | None = None
-    fd = proc.stdout.fileno()
-    try:
-        deadline = time.monotonic() + APT_UPGRADE_TIMEOUT
+
+    def __init__(self, hostname: str):
+        self.hostname = hostname
+        self.kept_back = False
+        self.manual_intervention = False
+        self._conffile: str | None = None  # from the last "Configuration file" line
+        self._partial = bytearray()
+        self._tail = bytearray()
+        self._debug = update_tracker_logger.isEnabledFor(logging.DEBUG)
+
+    def feed(self, chunk: bytes) -> str | None:
+        """Scan a chunk of output.
+
+        Returns:
+            the conffile being asked about, if the output now ends in a dpkg conffile prompt
+        """
+        self._keep(chunk)
+        self._partial += chunk
+        if (end := self._partial.rfind(b'\n')) >= 0:
+            for line in self._partial[:end].split(b'\n'):
+                self._scan(line)
+            del self._partial[:end + 1]
+        if len(self._partial) > MAX_LINE_BYTES:
+            self._scan(self._partial)
+            self._partial.clear()
+        if (m := _CONFFILE_PROMPT.search(self._partial)) is None:
+            return None
+        return self._conffile or m[1].decode('utf-8', errors='replace')
+
+    def answered(self, response: str) -> None:
+        """Record the response sent to the prompt feed returned."""
+        answer = f'{response}\n'.encode()
+        self._keep(answer)
+        self._scan(self._partial + answer.rstrip())
+        self._partial.clear()
+        self._conffile = None
+
+    def tail(self) -> str:
+        """The end of the output, for error messages."""
+        return bytes(self._tail[-TAIL_BYTES:]).decode('utf-8', errors='replace').strip()[-500:]
+
+    def _keep(self, data: bytes) -> None:
+        self._tail += data
+        if len(self._tail) > 2 * TAIL_BYTES:
+            del self._tail[:-TAIL_BYTES]
+
+    def _scan(self, line: bytes | bytearray) -> None:
+        if self._debug:
+            update_tracker_logger.debug(f"{self.hostname}: {line.decode('utf-8', errors='replace').rstrip()}")
+        if not self.kept_back and any(p in line for p in _KEPT_BACK_PATTERNS):
+            self.kept_back = True
+        if not self.manual_intervention and any(p in line for p in _MANUAL_INTERVENTION_PATTERNS):
+            self.manual_intervention = True
+        if (cf := _CONFIG_FILE_RE.search(line)) is not None:
+            self._conffile = cf[1].decode('utf-8', errors='replace')
+
+
+class AptUpgrade:
+    """apt-get update then apt-get -y upgrade on one host, pausable at conffile prompts.
+
+    step() runs the upgrade until it finishes or dpkg asks about a conffile that has no
+    entry in conffile_choices. A paused upgrade leaves apt waiting on the prompt and holds
+    no thread; answer() the prompt and call step() again to resume. Time spent paused
+    does not count towards APT_UPGRADE_TIMEOUT.
+    """
+
+    def __init__(self, ssh: SshPool, hostname: str, conffile_choices: dict[str, str] | None = None):
+        self.ssh = ssh
+        self.hostname = hostname
+        self.conffile_choices = conffile_choices or {}
+        self.prompt: str | None = None  # conffile dpkg is waiting on, while paused
+        self._proc: subprocess.Popen | None = None
+        self._output = AptOutput(hostname)
+        self._remaining = float(APT_UPGRADE_TIMEOUT)
+
+    def step(self) -> tuple[bool, str] | None:
+        """Run until the upgrade finishes or pauses.
+
+        Returns:
+            (success, message) when finished; None when paused at self.prompt
+        """
+        if self.prompt is not None:
+            raise RuntimeError(f"{self.hostname}: conffile prompt for {self.prompt} not answered")
+        if self._proc is None:
+            # Step 1: refresh package cache
+            update_result = self.ssh.run(self.hostname,
+                                         'DEBIAN_FRONTEND=noninteractive /usr/bin/sudo apt-get update -qq')
+            if update_result.returncode != 0:
+                detail = update_result.stderr.strip() or f"exit {update_result.returncode}"
+                return False, f"apt-get update failed: {detail}"
+
+            # Step 2: upgrade packages, streaming output via Popen
+            self._proc = self.ssh.popen(
+                self.hostname,
+                'DEBIAN_FRONTEND=noninteractive /usr/bin/sudo apt-get -y upgrade --allow-downgrades',
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+            )
+
+        proc = self._proc
+        try:
+            if not self._read():
+                return None
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.close()
+            return False, f"timed out after {APT_UPGRADE_TIMEOUT}s"
+        except BaseException:
+            self.close()
+            raise
+        proc.stdin.close()
+
+        output = self._output
+        if proc.returncode == 0:
+            if output.kept_back:
+                return True, "done (some packages kept back — may require manual upgrade)"
+            return True, "done"
+
+        if output.manual_intervention:
+            return False, f"requires manual intervention: {output.tail()}"
+
+        return False, output.tail() or f"exit code {proc.returncode}"
+
+    def answer(self, response: str) -> None:
+        """Send 'Y' (install the new conffile) or 'N' (keep the old one) to the paused prompt."""
+        self.prompt = None
+        self._respond(response)
+
+    def close(self) -> None:
+        """Kill an upgrade that has not finished."""
+        if self._proc is None:
+            return
+        if self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        self._proc.stdin.close()
+
+    def _respond(self, response: str) -> None:
+        self._output.answered(response)
+        self._proc.stdin.write(response + '\n')
+        self._proc.stdin.flush()
+
+    def _read(self) -> bool:
+        """Stream output until EOF (True) or an unanswered conffile prompt (False)."""
+        proc = self._proc
+        fd = proc.stdout.fileno()
+        deadline = time.monotonic() + self._remaining
         while True:
             remaining = deadline - time.monotonic()
             if remaining <= 0:
                 raise subprocess.TimeoutExpired(proc.args, APT_UPGRADE_TIMEOUT)
             ready, _, _ = select.select([fd], [], [], min(remaining, 1.0))
             if ready:
-                chunk = os.read(fd, 4096).decode('utf-8', errors='replace')
+                chunk = os.read(fd, 65536)
                 if not chunk:
-                    break  # EOF
-                buf += chunk
-                # Flush complete lines
-                while '\n' in buf:
-                    line, buf = buf.split('\n', 1)
-                    line += '\n'
-                    output_lines.append(line)
-                    update_tracker_logger.debug(f"{hostname}: {line.rstrip()}")
-                    cf = _CONFIG_FILE_RE.search(line)
-                    if cf:
-                        last_conffile_path = cf.group(1)
-                # Check if the partial buffer (no newline) is a conffile prompt
-                m = _CONFFILE_PROMPT.search(buf)
-                if m:
-                    conffile_path = last_conffile_path or m.group(1)
-                    response = 'N'  # default: keep old
-                    if conffile_choices and conffile_path in conffile_choices:
-                        response = 'Y' if conffile_choices[conffile_path] == 'new' else 'N'
-                        update_tracker_logger.debug(
-                            f"{hostname}: conffile {conffile_path} auto-responding {response}")
-                    elif prompt_queue is not None:
-                        event: threading.Event = threading.Event()
-                        holder: list = ['N']
-                        prompt_queue.put((hostname, conffile_path, event, holder))
-                        event.wait()  # block thread until main thread answers
-                        response = holder[0]
-                    else:
-                        update_tracker_logger.debug(
-                            f"{hostname}: conffile {conffile_path} no queue, defaulting N")
-                    output_lines.append(buf + response + '\n')
-                    buf = ''
-                    last_conffile_path = None
-                    proc.stdin.write(response + '\n')
-                    proc.stdin.flush()
+                    return True  # EOF
+                conffile_path = self._output.feed(chunk)
+                if conffile_path is None:
+                    continue
+                if conffile_path not in self.conffile_choices:
+                    self.prompt = conffile_path
+                    self._remaining = deadline - time.monotonic()
+                    return False
+                response = 'Y' if self.conffile_choices[conffile_path] == 'new' else 'N'
+                update_tracker_logger.debug(f"{self.hostname}: conffile {conffile_path} auto-responding {response}")
+                self._respond(response)
             elif proc.poll() is not None:
-                break  # process exited, no more output
-        proc.wait(timeout=10)
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        proc.wait()
-        return False, f"timed out after {APT_UPGRADE_TIMEOUT}s"
-    finally:
-        proc.stdin.close()
+                return True  # process exited, no more output
 
-    combined = ''.join(output_lines)
-    if proc.returncode == 0:
-        if 'kept back' in combined or 'not upgraded' in combined:
-            return True, "done (some packages kept back — may require manual upgrade)"
-        return True, "done"
 
-    for pat in _MANUAL_INTERVENTION_PATTERNS:
-        if pat in combined:
-            return False, f"requires manual intervention: {combined.strip()[-500:]}"
+def run_apt_upgrade(ssh: SshPool, hostname: str,
+                    conffile_choices: dict[str, str] | None = None) -> tuple[bool, str]:
+    """Run AptUpgrade to completion, answering conffile prompts from conffile_choices
+    and with N (keep old) when there is no stored choice.
 
-    return False, combined.strip()[-500:] or f"exit code {proc.returncode}"
+    Returns (success, message).
+    """
+    upgrade = AptUpgrade(ssh, hostname, conffile_choices)
+    while (result := upgrade.step()) is None:
+        update_tracker_logger.debug(f"{hostname}: conffile {upgrade.prompt} no stored choice, defaulting N")
+        upgrade.answer('N')
+    return result
 
 
-def find_dpkg_new_files(hostname: str, account: str, keyfile: Path, timeout: int) -> list[str]:
+def find_dpkg_new_files(ssh: SshPool, hostname: str) -> list[str]:
     """Return list of .dpkg-new paths on the remote host (conffile conflicts)."""
-    result = subprocess.run(
-        ['ssh'] + _ssh_opts(keyfile, timeout) + [
-            f'{account}@{hostname}',
-            'find /etc /usr/share -name "*.dpkg-new" 2>/dev/null'
-        ],
-        capture_output=True, text=True, timeout=30
-    )
+    result = ssh.run(hostname, 'find /etc /usr/share -name "*.dpkg-new" 2>/dev/null', timeout=30)
     return [f.strip() for f in result.stdout.splitlines() if f.strip()]
 
 
@@ -279,8 +362,8 @@ def get_conffile_choices(conn: psycopg.Connection, hostname: str) -> dict[str, s
     return {row[0]: row[1] for row in cursor.fetchall()}
 
 
-def apply_conffile_choices_remote(hostname: str, account: str, keyfile: Path,
-                                   timeout: int, choices: dict[str, str]) -> tuple[bool, str]:
+def apply_conffile_choices_remote(ssh: SshPool, hostname: str,
+                                  choices: dict[str, str]) -> tuple[bool, str]:
     """Apply stored conffile choices on the remote host by moving or removing .dpkg-new files."""
     cmds = []
     for conffile, choice in choices.items():
@@ -289,17 +372,15 @@ def apply_conffile_choices_remote(hostname: str, account: str, keyfile: Path,
             cmds.append(f'[ -f "{dpkg_new}" ] && /usr/bin/sudo mv "{dpkg_new}" "{conffile}" || true')
         else:
             cmds.append(f'/usr/bin/sudo rm -f "{dpkg_new}"')
-    result = subprocess.run(
-        ['ssh'] + _ssh_opts(keyfile, timeout) + [f'{account}@{hostname}', '; '.join(cmds)],
-        capture_output=True, text=True, timeout=60
-    )
+    result = ssh.run(hostname, '; '.join(cmds), timeout=60)
     if result.returncode != 0:
         return False, result.stderr.strip()
     return True, "ok"
 
 
-def do_update(conn: psycopg.Connection, account: str, keyfile: Path, timeout: int,
-              host_spec:HostSpec):
+def do_update(conn: psycopg.Connection, ssh_user: SshUser, timeout: int,
+              host_spec:HostSpec, groups: dict[str, list[str]] | None = None,
+              policy: RolloutPolicy | None = None):
     from update_tracker.database import report as db_report
     issues = db_report(conn, host_spec)
 
@@ -333,53 +414,138 @@ def do_update(conn: psycopg.Connection, account: str, keyfile: Path, timeout: in
     if not hosts_to_update:
         return
 
-    # Run all upgrades concurrently, servicing conffile prompts on the main thread
-    print(f"\nRunning updates on {len(hosts_to_update)} server(s)...")
-    prompt_queue: queue.Queue = queue.Queue()
-    futures: dict[concurrent.futures.Future, str] = {}
+    policy = policy or RolloutPolicy()
+    try:
+        plan = plan_waves(hosts_to_update, groups or {}, policy)
+    except ValueError as e:
+        print(e)
+        return
+
+    # Run each wave's upgrades concurrently; the main thread only wakes for completions,
+    # conffile prompts and the operator's answers
+    waves = plan.waves
+    print(f"\nRunning updates on {len(hosts_to_update)} server(s) in {len(waves)} wave(s)...")
+    events: queue.Queue = queue.Queue()
+    answers = _StdinReader(events)
     results: dict[str, tuple[bool, str]] = {}
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for hostname in hosts_to_update:
-            f = executor.submit(run_apt_upgrade, hostname, account, keyfile, timeout,
-                                None, prompt_queue)
-            futures[f] = hostname
-
-        pending = set(futures.keys())
-        while pending:
-            # Service any conffile prompts from worker threads
-            while True:
-                try:
-                    hostname, conffile_path, event, holder = prompt_queue.get_nowait()
-                    print(f"\n{hostname}: conffile prompt — {conffile_path}")
-                    ans = input("  Keep old (O) or install new (N)? [O/n]: ").strip().lower()
-                    choice = 'new' if ans == 'n' else 'old'
-                    save_conffile_choice(conn, hostname, conffile_path, choice)
-                    holder[0] = 'Y' if choice == 'new' else 'N'
-                    event.set()
-                    print(f"  Stored: {choice}")
-                except queue.Empty:
-                    break
-
-            # Check for completed futures (short timeout to stay responsive to prompts)
-            done, pending = concurrent.futures.wait(pending, timeout=0.5)
-            for future in done:
-                hostname = futures[future]
-                try:
-                    success, msg = future.result()
-                    results[hostname] = (success, msg)
-                    print(f"  {hostname}: {'done' if success else f'FAILED: {msg}'}")
-                    if success:
-                        update_tracker_logger.info(f"{hostname}: apt upgrade: {msg}")
-                    else:
-                        update_tracker_logger.error(f"{hostname}: apt upgrade failed: {msg}")
-                except Exception as e:
-                    results[hostname] = (False, str(e))
-                    print(f"  {hostname}: FAILED: {e}")
-                    update_tracker_logger.error(f"{hostname}: apt upgrade exception: {e}")
-
-
-def do_apply(conn: psycopg.Connection, account: str, keyfile: Path, timeout: int):
+    with SshPool(ssh_user, timeout) as ssh, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(policy.wave_size, policy.canary, 1)) as executor:
+        total_failed = 0
+        for number, wave in enumerate(waves, 1):
+            canary = plan.canary and number == 1
+            print(f"\nWave {number}/{len(waves)}{' (canary)' if canary else ''}: {len(wave)} server(s)")
+            _run_wave(conn, executor, ssh, wave, events, answers, results)
+
+            failed = sum(1 for h in wave if not results[h][0])
+            total_failed += failed
+            reason = stop_reason(policy, canary, len(wave) - failed, failed, total_failed)
+            if reason and number < len(waves):
+                not_run = sum(len(w) for w in waves[number:])
+                print(f"\nStopping rollout: {reason}; {not_run} server(s) not updated")
+                update_tracker_logger.error(f"Rollout stopped after wave {number}: {reason}")
+                break
+
+    succeeded = sum(1 for ok, _ in results.values() if ok)
+    print(f"\n{succeeded} of {len(hosts_to_update)} server(s) updated, {len(results) - succeeded} failed")
+
+
+class _StdinReader:
+    """Put each line typed on stdin on an event queue as ('answer', line), and
+    ('answer', None) at end of input. The reading thread starts on first use."""
+
+    def __init__(self, events: queue.Queue):
+        self._events = events
+        self._thread: threading.Thread | None = None
+        self.closed = False
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._read, name='stdin', daemon=True)
+            self._thread.start()
+
+    def _read(self) -> None:
+        for line in sys.stdin:
+            self._events.put(('answer', line))
+        self.closed = True
+        self._events.put(('answer', None))
+
+
+def _run_wave(conn: psycopg.Connection, executor: concurrent.futures.Executor, ssh: SshPool,
+              wave: list[str], events: queue.Queue, answers: _StdinReader,
+              results: dict[str, tuple[bool, str]]):
+    """Run a wave's upgrades to completion.
+
+    Each AptUpgrade.step runs on the executor and reports back through events when it
+    finishes or pauses; a paused upgrade gives its worker back until the operator's
+    answer arrives, when it is resubmitted. Prompts are asked one at a time, in the
+    order they arrive.
+    """
+    def submit(upgrade: AptUpgrade):
+        future = executor.submit(upgrade.step)
+        future.add_done_callback(lambda f: events.put(('done', upgrade, f)))
+
+    def ask(upgrade: AptUpgrade):
+        print(f"\n{upgrade.hostname}: conffile prompt — {upgrade.prompt}")
+        print("  Keep old (O) or install new (N)? [O/n]: ", end='', flush=True)
+
+    for hostname in wave:
+        submit(AptUpgrade(ssh, hostname))
+
+    prompts: deque[AptUpgrade] = deque()
+    running = len(wave)
+    while running:
+        event = events.get()
+        if event[0] == 'answer':
+            line = event[1]
+            # at end of input every waiting prompt keeps the old file
+            for _ in range(1 if line is not None else len(prompts)):
+                if not prompts:
+                    break  # typed with no question pending
+                upgrade = prompts.popleft()
+                choice = 'new' if line is not None and line.strip().lower() == 'n' else 'old'
+                save_conffile_choice(conn, upgrade.hostname, upgrade.prompt, choice)
+                print(f"  Stored: {choice}")
+                upgrade.answer('Y' if choice == 'new' else 'N')
+                submit(upgrade)
+            if prompts:
+                ask(prompts[0])
+            continue
+
+        _, upgrade, future = event
+        hostname = upgrade.hostname
+        try:
+            result = future.result()
+        except Exception as e:
+            result = None
+            results[hostname] = (False, str(e))
+            print(f"  {hostname}: FAILED: {e}")
+            update_tracker_logger.error(f"{hostname}: apt upgrade exception: {e}")
+        else:
+            if result is None:
+                prompts.append(upgrade)
+                if answers.closed:
+                    events.put(('answer', None))
+                elif len(prompts) == 1:
+                    answers.start()
+                    ask(upgrade)
+                continue
+            success, msg = result
+            results[hostname] = (success, msg)
+            print(f"  {hostname}: {'done' if success else f'FAILED: {msg}'}")
+            if success:
+                update_tracker_logger.info(f"{hostname}: apt upgrade: {msg}")
+            else:
+                update_tracker_logger.error(f"{hostname}: apt upgrade failed: {msg}")
+        finally:
+            if hostname in results:
+                ssh.forget(hostname)  # finished; a paused upgrade keeps its master
+        running -= 1
+        if prompts:
+            ask(prompts[0])  # the question scrolled away; show it again
+
+
+def do_apply(conn: psycopg.Connection, ssh_user: SshUser, timeout: int):
     cursor = conn.cursor()
     cursor.execute('SELECT DISTINCT hostname FROM audit.conffile_choices ORDER BY hostname')
     hosts = [row[0] for row in cursor.fetchall()]
@@ -388,39 +554,40 @@ def do_apply(conn: psycopg.Connection, account: str, keyfile: Path, timeout: int
         print("No stored conffile choices.")
         return
 
-    for hostname in hosts:
-        choices = get_conffile_choices(conn, hostname)
-        print(f"\n{hostname}: {len(choices)} stored conffile choice(s)")
-        for conffile, choice in sorted(choices.items()):
-            print(f"  {conffile}: {choice}")
+    with SshPool(ssh_user, timeout) as ssh:
+        for hostname in hosts:
+            choices = get_conffile_choices(conn, hostname)
+            print(f"\n{hostname}: {len(choices)} stored conffile choice(s)")
+            for conffile, choice in sorted(choices.items()):
+                print(f"  {conffile}: {choice}")
 
-        answer = input("  Apply choices and re-run upgrade (N/y)? ").strip().lower()
-        if answer != 'y':
-            print("  Skipped.")
-            continue
+            answer = input("  Apply choices and re-run upgrade (N/y)? ").strip().lower()
+            if answer != 'y':
+                print("  Skipped.")
+                continue
 
-        print("  Applying conffile choices...", end=' ', flush=True)
-        ok, msg = apply_conffile_choices_remote(hostname, account, keyfile, timeout, choices)
-        print("done." if ok else f"FAILED: {msg}")
-        if not ok:
-            continue
+            print("  Applying conffile choices...", end=' ', flush=True)
+            ok, msg = apply_conffile_choices_remote(ssh, hostname, choices)
+            print("done." if ok else f"FAILED: {msg}")
+            if not ok:
+                continue
 
-        print("  Running apt-get upgrade...", end=' ', flush=True)
-        try:
-            success, msg = run_apt_upgrade(hostname, account, keyfile, timeout, choices)
-            print(msg)
-            if success:
-                update_tracker_logger.info(f"{hostname}: apply upgrade: {msg}")
-                cursor.execute('DELETE FROM audit.conffile_choices WHERE hostname = %s', (hostname,))
-                conn.commit()
-            else:
-                update_tracker_logger.error(f"{hostname}: apply upgrade failed: {msg}")
-        except subprocess.TimeoutExpired:
-            print(f"FAILED: timed out after {APT_UPGRADE_TIMEOUT}s")
-            update_tracker_logger.error(f"{hostname}: apply upgrade timed out")
-        except Exception as e:
-            print(f"FAILED: {e}")
-            update_tracker_logger.error(f"{hostname}: apply upgrade exception: {e}")
+            print("  Running apt-get upgrade...", end=' ', flush=True)
+            try:
+                success, msg = run_apt_upgrade(ssh, hostname, choices)
+                print(msg)
+                if success:
+                    update_tracker_logger.info(f"{hostname}: apply upgrade: {msg}")
+                    cursor.execute('DELETE FROM audit.conffile_choices WHERE hostname = %s', (hostname,))
+                    conn.commit()
+                else:
+                    update_tracker_logger.error(f"{hostname}: apply upgrade failed: {msg}")
+            except subprocess.TimeoutExpired:
+                print(f"FAILED: timed out after {APT_UPGRADE_TIMEOUT}s")
+                update_tracker_logger.error(f"{hostname}: apply upgrade timed out")
+            except Exception as e:
+                print(f"FAILED: {e}")
+                update_tracker_logger.error(f"{hostname}: apply upgrade exception: {e}")
 
 
 def main():
@@ -429,30 +596,41 @@ def main():
                         help="Action to perform")
     add_common_args(parser)
     parser.add_argument('-s', '--server', action='append', help="limit to just these servers")
+    rollout = parser.add_argument_group('update rollout')
+    rollout.add_argument('--wave-size', type=int, default=RolloutPolicy.wave_size,
+                         help="Servers upgraded at once in each wave after the canary")
+    rollout.add_argument('--canary', type=int, default=RolloutPolicy.canary,
+                         help="Servers in the first wave, which must all succeed")
+    rollout.add_argument('--canary-group', help="Ansible inventory group to use as the first wave instead")
+    rollout.add_argument('--min-success', type=float, default=RolloutPolicy.min_success,
+                         help="Stop if a wave's success rate falls below this fraction")
+    rollout.add_argument('--max-failures', type=int, default=RolloutPolicy.max_failures,
+                         help="Stop once this many servers have failed")
 
     args = parser.parse_args()
     setup_logging(args)
     config = load_config(args)
-    a = config['ansible']
     c = config['cutoffs']
     timeout = c['ssh seconds']
 
-    conn = postgres_connect(config)
+    pool = connection_pool(config)
+    conn = pool.getconn()
 
     if args.action in ('kernel', 'update', 'apply'):
-        inv = query_ansible(a['config'], a['inventory'])
+        inv = load_inventory(config)
 
     if args.action == 'kernel':
         do_kernel(conn, inv.account, inv.keyfile, timeout)
     elif args.action == 'update':
-        host_spec = HostSpec(args.server, build_host_limits(config))
-        do_update(conn, inv.account, inv.keyfile, timeout, host_spec)
+        host_spec = HostSpec(args.server, build_host_limits(config, inv))
+        policy = RolloutPolicy(args.wave_size, args.canary, args.canary_group, args.min_success, args.max_failures)
+        do_update(conn, inv, timeout, host_spec, inv.ansible_groups, policy)
     elif args.action == 'apply':
-        do_apply(conn, inv.account, inv.keyfile, timeout)
+        do_apply(conn, inv, timeout)
     elif args.action == 'reboot':
         print("reboot action not yet implemented")
 
-    conn.close()
+    pool.putconn(conn)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,167 @@
+import datetime
+import queue
+import threading
+import time
+
+import psycopg
+
+from update_tracker import update_tracker_logger
+
+# One statement per batch: rows arrive as parallel arrays
+_UPSERT_SQL = '''
+    INSERT INTO audit.host_updates
+        (hostname, last_update, sample_time, kernel_needs_reboot, kernel_available, old_version, fingerprint)
+    SELECT * FROM unnest(%s::text[], %s::date[], %s::timestamptz[], %s::boolean[], %s::boolean[],
+                         %s::boolean[], %s::text[])
+    ON CONFLICT (hostname) DO UPDATE SET
+        last_update = EXCLUDED.last_update,
+        sample_time = EXCLUDED.sample_time,
+        kernel_needs_reboot = EXCLUDED.kernel_needs_reboot,
+        kernel_available = EXCLUDED.kernel_available,
+        old_version = EXCLUDED.old_version,
+        fingerprint = EXCLUDED.fingerprint
+'''
+
+_TOUCH_SQL = '''
+    UPDATE audit.host_updates hu SET sample_time = t.sample_time
+    FROM unnest(%s::text[], %s::timestamptz[]) AS t(hostname, sample_time)
+    WHERE hu.hostname = t.hostname
+'''
+
+# History rows are appended in a savepoint of the same transaction: samples by COPY, and
+# touched hosts as a copy of their (unchanged) current row at the new sample time
+_HISTORY_COPY = '''
+    COPY audit.host_update_samples
+        (hostname, last_update, sample_time, kernel_needs_reboot, kernel_available, old_version, fingerprint)
+    FROM STDIN
+'''
+
+_HISTORY_TOUCH_SQL = '''
+    INSERT INTO audit.host_update_samples
+        (hostname, last_update, sample_time, kernel_needs_reboot, kernel_available, old_version, fingerprint)
+    SELECT hu.hostname, hu.last_update, t.sample_time, hu.kernel_needs_reboot, hu.kernel_available,
+           hu.old_version, hu.fingerprint
+    FROM audit.host_updates hu
+    JOIN unnest(%s::text[], %s::timestamptz[]) AS t(hostname, sample_time) ON hu.hostname = t.hostname
+'''
+
+# (hostname, last_update, sample_time, kernel_needs_reboot, kernel_available, old_version, fingerprint)
+StoreRow = tuple[str, datetime.date | None, datetime.datetime, bool | None, bool | None, bool | None, str | None]
+# (hostname, sample_time)
+TouchRow = tuple[str, datetime.datetime]
+
+_STOP = object()
+
+
+class ResultWriter:
+    """Write scan results to audit.host_updates in batches from a background thread.
+
+    Results are queued by store/touch and flushed as one transaction whenever
+    batch_size rows are waiting or flush_seconds have passed. Each batch commits on
+    its own, so a failure never undoes earlier batches; a failed batch is retried
+    row by row so only the offending rows are lost (and logged).
+
+    With history, every sample is also appended to audit.host_update_samples; the
+    partition for the sample time must exist (see schema.maintain_sample_partitions).
+    History is written in a savepoint, so when it fails (a missing partition, say) the
+    current state is still stored; the failure is logged and counted in history_failed.
+    """
+
+    def __init__(self, conn: psycopg.Connection, batch_size: int = 100, flush_seconds: float = 5.0,
+                 history: bool = False):
+        self.conn = conn
+        self.history = history
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.written = 0
+        self.failed = 0
+        self.history_failed = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._queue.put(_STOP)
+        self._thread.join()
+        return False
+
+    def store(self, hostname: str, last_update: datetime.date | None, sample_time: datetime.datetime,
+              kernel_needs_reboot: bool | None = None, kernel_available: bool | None = None,
+              old_version: bool | None = None, fingerprint: str | None = None):
+        """Queue a full sample of hostname."""
+        self._queue.put(('store', (hostname, last_update, sample_time,
+                                   kernel_needs_reboot, kernel_available, old_version, fingerprint)))
+
+    def touch(self, hostname: str, sample_time: datetime.datetime):
+        """Queue an unchanged host: only its sample_time is updated."""
+        self._queue.put(('touch', (hostname, sample_time)))
+
+    def _run(self):
+        stores: dict[str, StoreRow] = {}
+        touches: dict[str, TouchRow] = {}
+        deadline = time.monotonic() + self.flush_seconds
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                if item is _STOP:
+                    stopping = True
+                else:
+                    kind, row = item
+                    # later results for the same host replace earlier ones
+                    (stores if kind == 'store' else touches)[row[0]] = row
+            except queue.Empty:
+                pass
+            waiting = len(stores) + len(touches)
+            if stopping or waiting >= self.batch_size or time.monotonic() >= deadline:
+                if waiting:
+                    self._flush(list(stores.values()), list(touches.values()))
+                    stores.clear()
+                    touches.clear()
+                deadline = time.monotonic() + self.flush_seconds
+
+    def _flush(self, stores: list[StoreRow], touches: list[TouchRow]):
+        try:
+            self._execute(stores, touches)
+            self.written += len(stores) + len(touches)
+            update_tracker_logger.debug(f"Wrote {len(stores)} samples, {len(touches)} unchanged hosts")
+        except Exception as e:
+            update_tracker_logger.warning(f"Batch of {len(stores) + len(touches)} rows failed ({e}), retrying rows")
+            self.conn.rollback()
+            for row in stores:
+                self._retry(row[0], [row], [])
+            for row in touches:
+                self._retry(row[0], [], [row])
+
+    def _retry(self, hostname: str, stores: list[StoreRow], touches: list[TouchRow]):
+        try:
+            self._execute(stores, touches)
+            self.written += 1
+        except Exception as e:
+            self.conn.rollback()
+            self.failed += 1
+            update_tracker_logger.error(f"Failed to store {hostname}: {e}")
+
+    def _execute(self, stores: list[StoreRow], touches: list[TouchRow]):
+        cursor = self.conn.cursor()
+        if stores:
+            cursor.execute(_UPSERT_SQL, [list(column) for column in zip(*stores)])
+        if touches:
+            cursor.execute(_TOUCH_SQL, [list(column) for column in zip(*touches)])
+        if self.history:
+            try:
+                with self.conn.transaction():
+                    if stores:
+                        with cursor.copy(_HISTORY_COPY) as copy:
+                            for row in stores:
+                                copy.write_row(row)
+                    if touches:
+                        cursor.execute(_HISTORY_TOUCH_SQL, [list(column) for column in zip(*touches)])
+            except psycopg.Error as e:
+                self.history_failed += len(stores) + len(touches)
+                update_tracker_logger.warning(
+                    f"History of {len(stores) + len(touches)} samples not recorded: {e}")
+        self.conn.commit()